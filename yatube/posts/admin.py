@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from . import search
+from .admin_tools import (AuthorFilter, PerformanceAdminMixin, PostFilter,
+                          UserFilter)
 from .models import Group, Post, Comment, Follow
 
 
@@ -9,7 +13,7 @@ class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -18,12 +22,24 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date', 'group',)
+    list_filter = ('pub_date', 'group', AuthorFilter)
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # вместо LIKE '%...%' по всей таблице - полнотекстовый индекс
+        if not search_term or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term)
+        if not search.match_query(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=RawSQL(*search.matching_ids_sql(search_term))), False
 
-class CommentAdmin(admin.ModelAdmin):
+
+class CommentAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'post',
@@ -31,18 +47,22 @@ class CommentAdmin(admin.ModelAdmin):
         'text',
         'created',
     )
+    list_select_related = ('post', 'author')
     search_fields = ('text',)
-    list_filter = ('created', 'author',)
+    list_filter = ('created', AuthorFilter, PostFilter)
+    autocomplete_fields = ('post', 'author')
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'author',
     )
-    search_fields = ('user', 'author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username',)
+    list_filter = (UserFilter, AuthorFilter)
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(Group, GroupAdmin)
@@ -0,0 +1,150 @@
+"""Режим админки для больших таблиц постов, комментариев и подписок.
+
+- фильтры по пользователю и посту - поле ввода вместо списка всех
+  пользователей в боковой панели;
+- количество строк без фильтров берется из статистики СУБД, а с
+  фильтрами считается не дальше settings.ADMIN_COUNT_LIMIT;
+- дальние страницы листаются по id (?after=<pk>) без OFFSET.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.utils.functional import cached_property
+
+from .utils import parse_id
+
+AFTER_VAR = 'after'
+
+
+def estimated_count(model):
+    """Примерное число строк таблицы из статистики СУБД или None."""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # заполняется командой ANALYZE
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    return int(str(row[0]).split()[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not self.object_list.query.has_filters():
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return self.object_list.order_by()[:limit].count()
+
+
+class KeysetChangeList(ChangeList):
+    def __init__(self, request, *args, **kwargs):
+        self.after = None
+        if ORDER_VAR not in request.GET:
+            # по id можно листать только в порядке по умолчанию (-pk)
+            self.after = parse_id(request.GET.get(AFTER_VAR))
+        self.next_after = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # сортировка, фильтры и номера страниц начинают листание заново
+        remove = [*(remove or []), AFTER_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        super().get_results(request)
+        if self.after is not None:
+            self.result_list = self.queryset.filter(pk__lt=self.after)[
+                :self.list_per_page]
+            self.multi_page = True
+        if ORDER_VAR in self.params or self.show_all:
+            return
+        # len() заполняет кеш queryset, formset list_editable берет его же
+        if len(self.result_list) == self.list_per_page:
+            *_, last = self.result_list
+            self.next_after = last.pk
+
+    @property
+    def next_query_string(self):
+        return self.get_query_string(
+            {AFTER_VAR: self.next_after}, [PAGE_VAR])
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода: значение подставляется в lookup."""
+    template = 'admin/posts/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        # фильтр показывается, только если lookups не пустой
+        return ((),)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name]),
+            'query_parts': [
+                (key, value) for key, value in changelist.params.items()
+                if key not in (self.parameter_name, PAGE_VAR, AFTER_VAR)],
+            'display': 'Все',
+        }
+
+
+class AuthorFilter(InputFilter):
+    title = 'автору (username)'
+    parameter_name = 'author'
+    lookup = 'author__username'
+
+
+class UserFilter(InputFilter):
+    title = 'пользователю (username)'
+    parameter_name = 'user'
+    lookup = 'user__username'
+
+
+class PostFilter(InputFilter):
+    title = 'посту (id)'
+    parameter_name = 'post'
+    lookup = 'post_id'
+
+    def queryset(self, request, queryset):
+        if self.value() and not self.value().isdigit():
+            return queryset.none()
+        return super().queryset(request, queryset)
+
+
+class PerformanceAdminMixin:
+    """Changelist без полного подсчета строк и с листанием по id."""
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    ordering = ('-pk',)
+    change_list_template = 'admin/posts/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
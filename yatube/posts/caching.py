@@ -0,0 +1,187 @@
+"""Версионированные (generation) ключи для кеша фрагментов.
+
+Каждый тег, например 'index', 'group:3' или 'feed:7', хранит в кеше номер
+поколения. Версия фрагмента собирается из поколений его тегов, поэтому
+инвалидация сводится к увеличению номера, а старые записи просто
+перестают читаться и вытесняются по таймауту. Для подбора таймаутов
+шаблонный тег fragment_cache считает попадания и промахи.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import FeedItem, Post
+
+INDEX = 'index'
+# numbered-страницы глубже INDEX_CACHE_PAGES и страницы по курсору
+INDEX_REST = 'index:rest'
+# названия групп выводятся в карточках постов на всех лентах
+GROUPS = 'groups'
+FRAGMENT_NAMES = ('index_page', 'group_page', 'profile_page', 'follow_page',
+                  'post_card')
+
+
+def _key(tag):
+    return f'generation:{tag}'
+
+
+def _initial():
+    # после вытеснения ключа поколение не должно совпасть со старым
+    return int(time.time() * 1000)
+
+
+def generation(*tags):
+    """Версия фрагмента, зависящего от тегов."""
+    keys = [_key(tag) for tag in tags]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial(), None)
+            values[key] = cache.get(key)
+    return '.'.join(str(values[key]) for key in keys)
+
+
+def bump(*tags):
+    for tag in tags:
+        try:
+            cache.incr(_key(tag))
+        except ValueError:
+            cache.set(_key(tag), _initial(), None)
+
+
+def group_tag(group_id):
+    return f'group:{group_id}'
+
+
+def author_tag(author_id):
+    return f'author:{author_id}'
+
+
+def feed_tag(user_id):
+    return f'feed:{user_id}'
+
+
+def post_tag(post_id):
+    return f'post:{post_id}'
+
+
+def follows_tag(user_id):
+    """Подписки и подписчики пользователя."""
+    return f'follows:{user_id}'
+
+
+def _stats_key(name, hit):
+    return f'fragment_stats:{name}:{"hits" if hit else "misses"}'
+
+
+def record_fragment(name, hit, count=1):
+    if not count:
+        return
+    key = _stats_key(name, hit)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.add(key, count, None)
+
+
+def fragment_stats(names=FRAGMENT_NAMES):
+    """{имя фрагмента: (попадания, промахи)}."""
+    values = cache.get_many(
+        [_stats_key(name, hit) for name in names for hit in (True, False)])
+    return {name: (values.get(_stats_key(name, True), 0),
+                   values.get(_stats_key(name, False), 0))
+            for name in names}
+
+
+def reset_fragment_stats(names=FRAGMENT_NAMES):
+    cache.delete_many(
+        [_stats_key(name, hit) for name in names for hit in (True, False)])
+
+
+def index_page_tag(number):
+    return f'index:page:{number}'
+
+
+def index_page_generation(page):
+    """Версия фрагмента страницы index."""
+    if page.number is not None and page.number <= (
+            settings.INDEX_CACHE_PAGES):
+        return generation(INDEX, index_page_tag(page.number))
+    return generation(INDEX, INDEX_REST)
+
+
+def post_index_page(post):
+    """Номер страницы index с постом или None, если она глубже кеша."""
+    limit = settings.INDEX_CACHE_PAGES * settings.POSTS_ON_PAGE
+    newer = Post.objects.filter(
+        Q(pub_date__gt=post.pub_date)
+        | Q(pub_date=post.pub_date, pk__gt=post.pk))[:limit].count()
+    if newer >= limit:
+        return None
+    return newer // settings.POSTS_ON_PAGE + 1
+
+
+def bump_index():
+    """Сдвинулись окна всех страниц: новый или удаленный пост, группа."""
+    bump(INDEX)
+
+
+def bump_index_post(post):
+    """Изменился пост, но не окна страниц: правка или комментарий."""
+    number = post_index_page(post)
+    if number is None:
+        bump(INDEX_REST)
+    else:
+        bump(index_page_tag(number), INDEX_REST)
+
+
+def feed_readers(post):
+    """Читатели, в материализованных лентах которых лежит пост."""
+    return FeedItem.objects.filter(post_id=post.pk).values_list(
+        'user_id', flat=True)
+
+
+def bump_post_tags(post, old_group_id=None, readers=None):
+    """Сбрасывает ленты группы, автора и подписчиков, где виден пост."""
+    if readers is None:
+        readers = feed_readers(post)
+    tags = [post_tag(post.pk), author_tag(post.author_id)]
+    tags += [group_tag(group_id)
+             for group_id in {post.group_id, old_group_id} - {None}]
+    tags += [feed_tag(user_id) for user_id in readers]
+    bump(*tags)
+
+
+def bump_post(post):
+    """Изменилось отображение поста на всех страницах, где он есть."""
+    bump_index_post(post)
+    bump_post_tags(post)
+
+
+def group_page_generation(group):
+    return generation(group_tag(group.pk))
+
+
+def profile_page_generation(author):
+    return generation(author_tag(author.pk), GROUPS)
+
+
+def follow_page_generation(user, pulled_authors=()):
+    """Версия ленты подписок: своя лента плюс pull-авторы из подписок."""
+    return generation(feed_tag(user.pk), GROUPS, *(
+        author_tag(author_id) for author_id in pulled_authors))
+
+
+def card_key(post, variant, groups_generation):
+    """Ключ отрисованной карточки поста.
+
+    Правка поста меняет updated, комментарии - счетчик и последний
+    комментарий, переименование группы - поколение GROUPS, поэтому явно
+    сбрасывать карточки не нужно.
+    """
+    latest_comment_id = getattr(post, 'latest_comment_id', None)
+    return (f'post_card:{post.pk}:{post.updated.timestamp():.6f}:'
+            f'{post.comments_count}:{latest_comment_id}:'
+            f'{variant}:{groups_generation}')
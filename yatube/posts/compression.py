@@ -0,0 +1,223 @@
+"""Сжатие ответов и минификация HTML.
+
+CompressionMiddleware сжимает текстовые ответы brotli (если установлен
+пакет brotli) или gzip по Accept-Encoding. Обычные ответы сжимаются от
+settings.COMPRESS_MIN_SIZE байт, потоковые - всегда, по мере отдачи.
+Файлы (FileResponse) не трогаются: их тело уходит через sendfile, а
+статика сжата заранее. При settings.HTML_MINIFY из HTML убираются
+отступы: пробелы с переводом строки заменяются одним переводом строки,
+содержимое pre, textarea, script и style не меняется.
+
+Ответы, для которых выдавался CSRF-токен (CSRF_COOKIE_USED), не
+сжимаются, а только минифицируются: токен рядом с отраженным вводом
+(поиск, формы поста и комментария) делает сжатие уязвимым к BREACH, а
+случайная добивка длины лишь замедляет атаку.
+
+Байты исходно, после минификации и отправленные по каждому view
+копятся в памяти процесса и пачками уходят в кеш, их показывает
+команда compression_stats.
+"""
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from .staticfiles import accepted_encodings, brotli
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+PROTECTED_RE = re.compile(
+    r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+INDENT_RE = re.compile(r'[ \t\r\f\v]*\n\s*')
+STATS_FIELDS = ('responses', 'original', 'minified', 'sent')
+VIEWS_KEY = 'compression_stats:views'
+
+
+def minify_html(html):
+    parts = PROTECTED_RE.split(html)
+    # split возвращает текст, блок целиком и имя тега по очереди
+    for index in range(0, len(parts), 3):
+        parts[index] = INDENT_RE.sub('\n', parts[index])
+    return ''.join(
+        part for index, part in enumerate(parts) if index % 3 != 2)
+
+
+def _stats_key(view_name, field):
+    return f'compression_stats:{view_name}:{field}'
+
+
+class StatsBuffer:
+    """Счетчики в памяти процесса, сбрасываемые в кеш пачкой.
+
+    Запрос только прибавляет к словарю; в кеш счетчики уходят раз в
+    settings.COMPRESSION_STATS_FLUSH_INTERVAL секунд, по add + incr на
+    ключ, так что одновременные сбросы разных процессов не теряют
+    значений.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.views = set()
+        self.flushed = time.monotonic()
+
+    def add(self, view_name, values):
+        with self.lock:
+            counts = self.counts.setdefault(
+                view_name, [0] * len(STATS_FIELDS))
+            for index, value in enumerate(values):
+                counts[index] += value
+            due = (time.monotonic() - self.flushed
+                   >= settings.COMPRESSION_STATS_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.views.update(counts)
+            views = set(self.views)
+            self.flushed = time.monotonic()
+        if not counts:
+            return
+        # каждый сброс заново добавляет известные процессу имена, поэтому
+        # гонка двух процессов за список теряет имя только до их
+        # следующего сброса
+        known = cache.get(VIEWS_KEY, set())
+        if not views <= known:
+            cache.set(VIEWS_KEY, known | views, None)
+        for view_name, values in counts.items():
+            for field, value in zip(STATS_FIELDS, values):
+                key = _stats_key(view_name, field)
+                cache.add(key, 0, None)
+                cache.incr(key, value)
+
+
+_buffer = StatsBuffer()
+
+
+def record(view_name, original, minified, sent):
+    _buffer.add(view_name, (1, original, minified, sent))
+
+
+def compression_stats():
+    """{view: (ответов, байт исходно, после минификации, отправлено)}."""
+    _buffer.flush()
+    views = sorted(cache.get(VIEWS_KEY, set()))
+    values = cache.get_many([_stats_key(view_name, field)
+                             for view_name in views
+                             for field in STATS_FIELDS])
+    return {view_name: tuple(values.get(_stats_key(view_name, field), 0)
+                             for field in STATS_FIELDS)
+            for view_name in views}
+
+
+def reset_compression_stats():
+    _buffer.flush()
+    views = cache.get(VIEWS_KEY, set())
+    with _buffer.lock:
+        _buffer.views.clear()
+    cache.delete_many([VIEWS_KEY] + [_stats_key(view_name, field)
+                                     for view_name in views
+                                     for field in STATS_FIELDS])
+
+
+def compressor(encoding):
+    """Объект с compress/flush для потокового сжатия."""
+    if encoding == 'br':
+        return BrotliCompressor()
+    # wbits=31 - формат gzip
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.compressible(response):
+            return response
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unknown'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if request.META.get('CSRF_COOKIE_USED'):
+            # BREACH: токен в сжатом теле подбирается по его длине
+            accepted = ()
+        encoding = None
+        if 'br' in accepted and brotli is not None:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        if response.streaming:
+            if encoding is not None:
+                response.streaming_content = self.compress_stream(
+                    response.streaming_content, encoding, view_name)
+                del response['Content-Length']
+                self.mark_encoded(response, encoding)
+            return response
+        original = len(response.content)
+        if settings.HTML_MINIFY and response['Content-Type'].startswith(
+                'text/html'):
+            response.content = minify_html(
+                response.content.decode(response.charset)).encode(
+                    response.charset)
+        minified = len(response.content)
+        if encoding is not None and minified >= settings.COMPRESS_MIN_SIZE:
+            compress = compressor(encoding)
+            content = compress.compress(response.content) + compress.flush()
+            if len(content) < len(response.content):
+                response.content = content
+                self.mark_encoded(response, encoding)
+        response['Content-Length'] = str(len(response.content))
+        record(view_name, original, minified, len(response.content))
+        return response
+
+    @staticmethod
+    def compressible(response):
+        return (response.status_code == 200
+                and not response.has_header('Content-Encoding')
+                and getattr(response, 'file_to_stream', None) is None
+                and response.get('Content-Type', '').startswith(
+                    COMPRESSIBLE_TYPES)
+                and 'no-transform' not in response.get('Cache-Control', ''))
+
+    @staticmethod
+    def mark_encoded(response, encoding):
+        # сжатое тело не совпадает побайтно: ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+    @staticmethod
+    def compress_stream(chunks, encoding, view_name):
+        compress = compressor(encoding)
+        original = sent = 0
+        for chunk in chunks:
+            original += len(chunk)
+            data = compress.compress(chunk)
+            if data:
+                sent += len(data)
+                yield data
+        data = compress.flush()
+        sent += len(data)
+        yield data
+        record(view_name, original, original, sent)
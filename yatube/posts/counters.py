@@ -0,0 +1,34 @@
+"""Денормализованные счетчики постов, подписчиков, подписок и комментариев.
+
+Счетчики обновляются сигналами в той же транзакции, что и запись, а
+расхождения исправляет команда reconcile_counters.
+"""
+from django.db.models import F
+
+from .models import Post, UserStats
+
+
+def bump_user(user_id, **deltas):
+    """Изменяет счетчики пользователя: bump_user(pk, posts_count=1)."""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    # счетчик не уходит ниже нуля, даже если успел разойтись с данными
+    floors = {f'{field}__gte': -delta
+              for field, delta in deltas.items() if delta < 0}
+    if UserStats.objects.filter(user_id=user_id, **floors).update(**changes):
+        return
+    if all(delta < 0 for delta in deltas.values()):
+        # счетчиков нет (пользователь удаляется) или они уже на нуле
+        return
+    UserStats.objects.get_or_create(user_id=user_id)
+    UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_comments(post_id, delta):
+    floors = {'comments_count__gte': -delta} if delta < 0 else {}
+    Post.objects.filter(pk=post_id, **floors).update(
+        comments_count=F('comments_count') + delta)
+
+
+def get_stats(user):
+    stats, _ = UserStats.objects.get_or_create(user=user)
+    return stats
@@ -0,0 +1,74 @@
+"""Валидаторы условных GET-запросов для страниц с постами.
+
+ETag собирается из поколений тегов кеша (см. caching), которые сигналы
+сдвигают при каждой записи, влияющей на страницу. Поэтому ответ 304
+отдается до запросов к постам и отрисовки шаблона. Страницы выглядят
+по-разному для разных пользователей, так что в ETag входит и
+пользователь, и строка запроса с номером страницы или курсором.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+
+from . import caching
+from .feed import request_pulled_authors
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def make_etag(request, *parts):
+    value = '|'.join(map(str, (
+        request.resolver_match.view_name, request.user.pk,
+        request.get_full_path(), *parts)))
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def index_etag(request):
+    # правка любого поста сдвигает INDEX_REST, новый или удаленный - INDEX
+    return make_etag(
+        request, caching.generation(caching.INDEX, caching.INDEX_REST))
+
+
+def group_posts_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return make_etag(
+        request, caching.generation(caching.group_tag(group_id)))
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return make_etag(request, caching.generation(
+        caching.author_tag(author_id), caching.follows_tag(author_id),
+        caching.GROUPS))
+
+
+def post_detail_etag(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        return None
+    # post - правка и комментарии, author - счетчик постов автора
+    return make_etag(request, caching.generation(
+        caching.post_tag(post_id), caching.author_tag(author_id),
+        caching.GROUPS))
+
+
+def post_comments_etag(request, post_id):
+    # комментарии сбрасывают тег поста
+    return make_etag(
+        request, request.is_ajax(),
+        caching.generation(caching.post_tag(post_id)))
+
+
+def follow_index_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return make_etag(request, caching.follow_page_generation(
+        request.user, request_pulled_authors(request)))
@@ -0,0 +1,307 @@
+"""Ленты подписок: гибрид push (fan-out on write) и pull (fan-in on read).
+
+Посты авторов, у которых меньше settings.FEED_PUSH_FOLLOWERS_LIMIT
+подписчиков, сразу раскладываются в материализованные ленты (FeedItem),
+поэтому follow_index читает один индексированный диапазон. Посты
+популярных авторов в ленты не пишутся: при чтении их свежие посты
+сливаются с материализованной лентой k-way слиянием. Длина ленты
+ограничена settings.FEED_MAX_LENGTH.
+
+Дозапись лент, когда автор опускается ниже порога, откладывается до
+коммита и выполняется после отдачи ответа (request_finished), как
+построение миниатюр.
+"""
+import heapq
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import FeedItem, Follow, Post, PostQuerySet, UserStats
+from .utils import count_key, invalidate_counts, seek
+
+FEED_CHUNK_SIZE = 500
+
+_local = threading.local()
+
+
+def _chunks(iterable, size=FEED_CHUNK_SIZE):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _followers(author_id):
+    return Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True).iterator()
+
+
+def followers_count(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first() or 0
+
+
+def is_pulled(author_id):
+    """Посты автора читаются при запросе, а не раскладываются по лентам."""
+    return followers_count(author_id) >= settings.FEED_PUSH_FOLLOWERS_LIMIT
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, чьи посты собираются при чтении."""
+    return list(Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gte=(
+            settings.FEED_PUSH_FOLLOWERS_LIMIT),
+    ).order_by().values_list('author_id', flat=True))
+
+
+def request_pulled_authors(request):
+    """pulled_authors() пользователя запроса, один раз на запрос:
+    они нужны и ETag ленты, и самой странице."""
+    if not hasattr(request, '_pulled_authors'):
+        request._pulled_authors = pulled_authors(request.user)
+    return request._pulled_authors
+
+
+def invalidate_feed_counts(user_ids):
+    invalidate_counts(*(count_key('feed', user_id) for user_id in user_ids))
+
+
+def trim_feeds(user_ids):
+    """Удаляет из лент всё, что старше settings.FEED_MAX_LENGTH записей."""
+    cutoff = FeedItem.objects.filter(
+        user_id=OuterRef('user_id')
+    ).order_by('-pub_date').values('pub_date')[
+        settings.FEED_MAX_LENGTH - 1:settings.FEED_MAX_LENGTH]
+    FeedItem.objects.filter(
+        user_id__in=user_ids,
+        pub_date__lt=Subquery(cutoff),
+    ).delete()
+
+
+def push_post(post):
+    """Добавляет пост в ленты подписчиков, если автор не из pull-группы.
+
+    Возвращает количество записанных строк ленты.
+    """
+    if is_pulled(post.author_id):
+        return 0
+    written = 0
+    for user_ids in _chunks(_followers(post.author_id)):
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, post_id=post.pk,
+                      pub_date=post.pub_date) for user_id in user_ids],
+            ignore_conflicts=True)
+        trim_feeds(user_ids)
+        invalidate_feed_counts(user_ids)
+        written += len(user_ids)
+    return written
+
+
+def push_bulk_posts(posts):
+    """Раскладывает посты, созданные через bulk_create.
+
+    Первичные ключи после bulk_create известны не на всех СУБД, поэтому
+    посты каждого автора перечитываются начиная с самой ранней даты пачки.
+    """
+    since = {}
+    for post in posts:
+        if post.author_id not in since or post.pub_date < since[
+                post.author_id]:
+            since[post.author_id] = post.pub_date
+    for author_id, pub_date in since.items():
+        if is_pulled(author_id):
+            continue
+        backfill_followers(author_id, Post.objects.filter(
+            author_id=author_id, pub_date__gte=pub_date))
+
+
+def backfill_followers(author_id, posts=None):
+    """Дописывает посты автора в ленты всех его подписчиков."""
+    for user_ids in _chunks(_followers(author_id)):
+        for user_id in user_ids:
+            backfill_feed(user_id, author_id, posts, trim=False)
+        trim_feeds(user_ids)
+        invalidate_feed_counts(user_ids)
+
+
+def backfill_feed(user_id, author_id, posts=None, trim=True):
+    """Заполняет ленту пользователя постами автора после подписки."""
+    if posts is None:
+        posts = Post.objects.filter(author_id=author_id)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.values_list(
+             'pk', 'pub_date')[:settings.FEED_MAX_LENGTH]],
+        ignore_conflicts=True)
+    if trim:
+        trim_feeds([user_id])
+
+
+def follow_author(user_id, author_id):
+    if not is_pulled(author_id):
+        backfill_feed(user_id, author_id)
+    invalidate_feed_counts([user_id])
+
+
+def unfollow_author(user_id, author_id):
+    """Чистит ленту после отписки.
+
+    Если автор опустился ниже порога, его посты, опубликованные в режиме
+    pull, дописываются в ленты оставшихся подписчиков.
+    """
+    prune_feed(user_id, author_id)
+    invalidate_feed_counts([user_id])
+    limit = settings.FEED_PUSH_FOLLOWERS_LIMIT
+    if followers_count(author_id) == limit - 1:
+        transaction.on_commit(lambda: _defer(author_id))
+
+
+def _defer(author_id):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        # вне запроса: команда управления, shell
+        backfill_demoted(author_id)
+    else:
+        pending.add(author_id)
+
+
+def backfill_demoted(author_id):
+    # к моменту запуска автор мог снова набрать подписчиков
+    if not is_pulled(author_id):
+        backfill_followers(author_id)
+
+
+def start_request():
+    _local.pending = set()
+
+
+def finish_request():
+    pending = getattr(_local, 'pending', None) or set()
+    _local.pending = None
+    for author_id in pending:
+        backfill_demoted(author_id)
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    FeedItem.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+class MergedFeed:
+    """Ленивая последовательность постов из нескольких источников.
+
+    Каждый источник упорядочен по (pub_date, pk); срез забирает из
+    каждого не больше нужного числа строк и сливает их через heapq.merge.
+    Объект подходит как object_list для Paginator, а filter() и
+    order_by() применяются ко всем источникам, что нужно для навигации
+    по курсору. counted - источники для count() всей ленты, если
+    посчитать их дешевле, чем каждый источник по отдельности; это могут
+    быть запросы к другим моделям, поэтому фильтры и курсор их не
+    касаются.
+    """
+
+    def __init__(self, sources, descending=True, counted=None):
+        self.sources = sources
+        self.descending = descending
+        self.counted = sources if counted is None else counted
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed(
+            [source.filter(*args, **kwargs) for source in self.sources],
+            self.descending, self.counted)
+
+    def order_by(self, *fields):
+        return MergedFeed(
+            [source.order_by(*fields) for source in self.sources],
+            fields[0].startswith('-'), self.counted)
+
+    def seek(self, cursor, forward=True):
+        return MergedFeed(
+            [seek(source, cursor, forward) for source in self.sources],
+            forward, self.counted)
+
+    def count(self):
+        return min(
+            sum(source[:settings.FEED_MAX_LENGTH].count()
+                for source in self.counted),
+            settings.FEED_MAX_LENGTH)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:settings.FEED_MAX_LENGTH])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = settings.FEED_MAX_LENGTH
+        if key.stop is not None:
+            stop = min(key.stop, stop)
+        merged = heapq.merge(
+            *(source[:stop] for source in self.sources),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=self.descending)
+        return list(islice(merged, start, stop))
+
+
+class FeedQuerySet(PostQuerySet):
+    """Посты материализованной ленты в порядке ее строк.
+
+    Сортировка и курсор идут по (pub_date, post_id) самой строки ленты,
+    поэтому страница читается диапазоном индекса feed_user_pub_date_idx.
+    Поля строки аннотируются через уже существующий join: отдельный
+    filter() по feed_items добавил бы второй.
+    """
+
+    ORDERING = ('-feed_pub_date', '-feed_post_id')
+
+    def for_user(self, user):
+        return self.filter(feed_items__user=user).annotate(
+            feed_pub_date=F('feed_items__pub_date'),
+            feed_post_id=F('feed_items__post_id'),
+        ).order_by(*self.ORDERING)
+
+    def seek(self, cursor, forward=True):
+        pub_date, pk = cursor
+        if forward:
+            return self.filter(
+                Q(feed_pub_date__lt=pub_date)
+                | Q(feed_pub_date=pub_date, feed_post_id__lt=pk)
+            ).order_by(*self.ORDERING)
+        return self.filter(
+            Q(feed_pub_date__gt=pub_date)
+            | Q(feed_pub_date=pub_date, feed_post_id__gt=pk)
+        ).order_by('feed_pub_date', 'feed_post_id')
+
+
+def get_feed(user, pulled=None):
+    """Посты ленты пользователя: материализованная часть плюс pull-авторы.
+
+    pulled - уже найденный список pull-авторов, см. pulled_authors().
+    """
+    pushed = FeedQuerySet(Post).select_related(
+        'author', 'group').for_user(user).with_latest_comment()
+    if pulled is None:
+        pulled = pulled_authors(user)
+    if not pulled:
+        return pushed
+    # для количества хватает двух COUNT: строки ленты и посты всех
+    # pull-авторов разом, а не запрос на каждого автора
+    counted = [
+        FeedItem.objects.filter(user=user).exclude(
+            post__author_id__in=pulled),
+        Post.objects.filter(author_id__in=pulled),
+    ]
+    return MergedFeed([pushed.exclude(author_id__in=pulled)] + [
+        Post.objects.select_related('author', 'group').filter(
+            author_id=author_id).with_latest_comment().order_by(
+                '-pub_date', '-pk')
+        for author_id in pulled], counted=counted)
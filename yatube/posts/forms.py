@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
 from .models import Post, Comment
+from .uploads import ImageTooLarge, OversizedUpload, normalize_upload
 
 
 class PostForm(forms.ModelForm):
@@ -18,6 +22,37 @@ class PostForm(forms.ModelForm):
             'image': 'Загрузите картинку к посту'
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # файл сверх лимита отброшен при приеме, содержимого у него нет
+        name = self.add_prefix('image')
+        self.image_too_large = isinstance(
+            self.files.get(name), OversizedUpload)
+        if self.image_too_large:
+            self.files = self.files.copy()
+            del self.files[name]
+
+    def clean_image(self):
+        if self.image_too_large:
+            raise forms.ValidationError(
+                'Файл больше %(limit)s МБ', code='too_large',
+                params={'limit': settings.POST_IMAGE_MAX_BYTES // 2 ** 20})
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return normalize_upload(image)
+        except ImageTooLarge:
+            raise forms.ValidationError(
+                'Картинка больше %(limit)s мегапикселей',
+                code='too_many_pixels',
+                params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6})
+        except (OSError, Image.DecompressionBombError):
+            # заголовок прочитался, а пиксели нет: файл обрезан или испорчен
+            raise forms.ValidationError(
+                self.fields['image'].error_messages['invalid_image'],
+                code='invalid_image')
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,42 @@
+"""Размеры и крошечная копия картинки поста, снятые при загрузке.
+
+Их хранят поля Post, поэтому шаблоны выводят width/height и заглушку
+до загрузки картинки, не открывая исходный файл.
+"""
+import base64
+from io import BytesIO
+
+from django.core.exceptions import SuspiciousFileOperation
+from PIL import Image
+
+PLACEHOLDER_SIZE = 16
+
+
+def image_metadata(file):
+    """(ширина, высота, data URI копии 16px) или None для не-картинки."""
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            width, height = image.size
+            # JPEG декодируется сразу в уменьшенном масштабе
+            image.draft('RGB', (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+            tiny = image.convert('RGB')
+            tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            buffer = BytesIO()
+            tiny.save(buffer, 'JPEG', quality=40)
+        file.seek(0)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        return None
+    placeholder = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{placeholder}'
+
+
+def fill_metadata(post):
+    """Заполняет поля картинки поста; False, если файл не прочитать."""
+    metadata = image_metadata(post.image) if post.image else None
+    if metadata is None:
+        post.image_width = post.image_height = None
+        post.image_placeholder = ''
+        return not post.image
+    post.image_width, post.image_height, post.image_placeholder = metadata
+    return True
@@ -0,0 +1,150 @@
+"""Хранилище метаданных миниатюр sorl-thumbnail с пакетным чтением.
+
+Поверх cached_db KVStore добавлены:
+- get_many - метаданные миниатюр всей страницы за один get_many кеша и
+  один запрос IN к базе вместо запроса на каждую картинку;
+- ограниченный LRU в памяти процесса (settings.THUMBNAIL_LRU_SIZE).
+  В LRU кладутся только найденные записи, поэтому новые миниатюры из
+  других процессов видны сразу. Удаленные - нет: сборщик мусора и
+  перехеширование удаляют миниатюры, а имя может вернуться с другой
+  картинкой. Поэтому удаление сдвигает поколение в общем кеше, и
+  процесс, заметив новое поколение, очищает свой LRU. Поколение
+  сверяется не чаще раза в settings.THUMBNAIL_LRU_CHECK_INTERVAL секунд.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+GENERATION_KEY = 'thumbnail_lru:generation'
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def __init__(self):
+        super().__init__()
+        self.lru = LRUCache(settings.THUMBNAIL_LRU_SIZE)
+        self.generation = None
+        self.checked = None
+
+    def generation_value(self):
+        generation = self.cache.get(GENERATION_KEY)
+        if generation is None:
+            # ключ вытеснен: новое значение заведомо не совпадет с прежним
+            self.cache.add(GENERATION_KEY, time.time_ns(), None)
+            generation = self.cache.get(GENERATION_KEY)
+        return generation
+
+    def sync_lru(self):
+        """Очищает LRU, если другой процесс удалял записи."""
+        now = time.monotonic()
+        if self.checked is not None and (
+                now - self.checked < settings.THUMBNAIL_LRU_CHECK_INTERVAL):
+            return
+        self.checked = now
+        generation = self.generation_value()
+        if generation != self.generation:
+            self.lru.clear()
+            self.generation = generation
+
+    def bump_generation(self):
+        self.generation_value()
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            # ключ вытеснили между чтением и увеличением
+            self.generation_value()
+
+    def _get_raw(self, key):
+        self.sync_lru()
+        value = self.lru.get(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                self.lru.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.lru.set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self.lru.delete(*keys)
+        self.bump_generation()
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.lru.clear()
+        self.bump_generation()
+
+    def get_many(self, image_files):
+        """{ключ ImageFile: ImageFile из хранилища или None}."""
+        self.sync_lru()
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        values = {}
+        for raw_key in keys:
+            value = self.lru.get(raw_key)
+            if value is not None:
+                values[raw_key] = value
+        missing = [raw_key for raw_key in keys if raw_key not in values]
+        if missing:
+            values.update(self.cache.get_many(missing))
+            missing = [raw_key for raw_key in missing
+                       if raw_key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            # как в _get_raw: отсутствие тоже кешируется, чтобы не ходить
+            # в базу повторно
+            fetched = {raw_key: found.get(
+                raw_key, cached_db_kvstore.EMPTY_VALUE)
+                for raw_key in missing}
+            self.cache.set_many(
+                fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        result = {}
+        for raw_key, key in keys.items():
+            value = values.get(raw_key)
+            if not value or value == cached_db_kvstore.EMPTY_VALUE:
+                result[key] = None
+                continue
+            self.lru.set(raw_key, value)
+            result[key] = deserialize_image_file(value)
+        return result
@@ -0,0 +1,113 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+
+
+def walk(root, directory):
+    """Файлы каталога рекурсивно, без списка всего дерева в памяти.
+
+    Возвращает пары (путь относительно root через /, stat).
+    """
+    try:
+        entries = os.scandir(os.path.join(root, directory))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f'{directory}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry.stat(follow_symlinks=False)
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT картинки постов, на которые не ссылается ни '
+        'один пост, вместе с их миниатюрами, и миниатюры, неизвестные '
+        'kvstore. Дерево обходится потоково, ссылки проверяются в базе '
+        'пачками, поэтому память не растет с числом файлов. Общие файлы '
+        'хранилища с адресацией по содержимому удаляются только здесь.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60 * 24,
+            help='не трогать файлы моложе стольких секунд: пост с только '
+                 'что загруженной картинкой мог еще не сохраниться')
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='пауза между пачками удалений, секунды')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только посчитать неиспользуемые файлы')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.checked = self.found = self.freed = 0
+        cutoff = time.time() - options['min_age']
+        upload_to = Post._meta.get_field('image').upload_to.rstrip('/')
+        thumbnail_prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for directory, find in ((upload_to, self.unused_images),
+                                (thumbnail_prefix, self.unknown_thumbnails)):
+            files = walk(settings.MEDIA_ROOT, directory)
+            for chunk in chunks(files, options['batch_size']):
+                self.checked += len(chunk)
+                old = {name: stat.st_size for name, stat in chunk
+                       if stat.st_mtime < cutoff}
+                unused = find(old)
+                if unused:
+                    self.delete(unused, old)
+                    if options['pause'] and not self.dry_run:
+                        time.sleep(options['pause'])
+        action = 'Можно удалить' if self.dry_run else 'Удалено'
+        self.stdout.write(
+            f'Проверено файлов: {self.checked}, {action.lower()}: '
+            f'{self.found} ({self.freed / 2 ** 20:.1f} МБ)')
+
+    def unused_images(self, sizes):
+        used = set(Post.objects.filter(image__in=list(sizes)).values_list(
+            'image', flat=True))
+        return [name for name in sizes if name not in used]
+
+    def unknown_thumbnails(self, sizes):
+        keys = {add_prefix(ImageFile(name, default.storage).key): name
+                for name in sizes}
+        known = set(KVStoreModel.objects.filter(
+            key__in=list(keys)).values_list('key', flat=True))
+        return [name for key, name in keys.items() if key not in known]
+
+    def delete(self, names, sizes):
+        self.found += len(names)
+        self.freed += sum(sizes[name] for name in names)
+        if self.dry_run:
+            return
+        for name in names:
+            if name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+                default_storage.delete(name)
+                continue
+            # миниатюры картинки и их записи в kvstore уходят вместе с ней
+            default.kvstore.delete(ImageFile(name, default.storage))
+            default_storage.delete(name)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.compression import compression_stats, reset_compression_stats
+
+
+def saved(before, after):
+    return f'{1 - after / before:.1%}' if before else '-'
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько байт сэкономили сжатие и минификация.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        self.stdout.write('view | responses | original | minified | sent | '
+                          'minify saved | compress saved')
+        for view_name, (responses, original, minified, sent) in (
+                compression_stats().items()):
+            self.stdout.write(
+                f'{view_name} | {responses} | {original} | {minified} | '
+                f'{sent} | {saved(original, minified)} | '
+                f'{saved(minified, sent)}')
+        if options['reset']:
+            reset_compression_stats()
@@ -0,0 +1,113 @@
+from statistics import mean
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from posts.feed import get_feed
+from posts.models import FeedItem, Follow, Post, UserStats
+
+User = get_user_model()
+PUSH_ONLY = 10 ** 9
+DEFAULT_DISTRIBUTIONS = ('10,10,10,10', '10,100,1000', '10,100,5000')
+
+
+def distribution(value):
+    try:
+        counts = [int(count) for count in value.split(',')]
+    except ValueError:
+        raise CommandError(f'Неверное распределение подписчиков: {value}')
+    if not counts or min(counts) < 1:
+        raise CommandError(f'Неверное распределение подписчиков: {value}')
+    return counts
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает push-ленты и гибридные push/pull-ленты: усиление '
+        'записи и время чтения первой страницы для разных распределений '
+        'числа подписчиков. Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--distribution', action='append', type=distribution,
+            help='число подписчиков каждого автора через запятую, '
+                 'например 10,100,5000; можно указать несколько раз')
+        parser.add_argument(
+            '--threshold', action='append', type=int,
+            help='значение FEED_PUSH_FOLLOWERS_LIMIT; можно указать '
+                 'несколько раз, по умолчанию push-only и 1000')
+        parser.add_argument(
+            '--posts', type=int, default=10,
+            help='сколько постов публикует каждый автор')
+        parser.add_argument(
+            '--reads', type=int, default=20,
+            help='сколько раз читать первую страницу ленты')
+        parser.add_argument('--page-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        distributions = options['distribution'] or [
+            distribution(value) for value in DEFAULT_DISTRIBUTIONS]
+        thresholds = options['threshold'] or [PUSH_ONLY, 1000]
+        self.stdout.write(
+            'distribution | threshold | rows/post | write ms/post | '
+            'read ms')
+        for counts in distributions:
+            for threshold in thresholds:
+                with override_settings(FEED_PUSH_FOLLOWERS_LIMIT=threshold):
+                    rows, write_time, read_time = self.measure(
+                        counts, options['posts'], options['reads'],
+                        options['page_size'])
+                label = 'push only' if threshold >= PUSH_ONLY else threshold
+                self.stdout.write(
+                    f'{",".join(map(str, counts))} | {label} | {rows:.1f} | '
+                    f'{write_time * 1000:.2f} | {read_time * 1000:.2f}')
+
+    def measure(self, counts, posts, reads, page_size):
+        try:
+            with transaction.atomic():
+                result = self.run(counts, posts, reads, page_size)
+                raise Rollback
+        except Rollback:
+            return result
+
+    def run(self, counts, posts, reads, page_size):
+        User.objects.bulk_create(
+            User(username=f'feed_benchmark_reader_{number}')
+            for number in range(max(counts)))
+        readers = list(User.objects.filter(
+            username__startswith='feed_benchmark_reader_').order_by('pk'))
+        authors = []
+        for number, count in enumerate(counts):
+            author = User.objects.create(
+                username=f'feed_benchmark_author_{number}')
+            Follow.objects.bulk_create(
+                Follow(user=reader, author=author)
+                for reader in readers[:count])
+            UserStats.objects.filter(user=author).update(
+                followers_count=count)
+            authors.append(author)
+
+        rows_before = FeedItem.objects.count()
+        started = perf_counter()
+        for number in range(posts):
+            for author in authors:
+                Post.objects.create(author=author, text=f'Пост {number}')
+        created = posts * len(authors)
+        write_time = (perf_counter() - started) / created
+        rows = (FeedItem.objects.count() - rows_before) / created
+
+        # первый читатель подписан на всех авторов распределения
+        timings = []
+        for _ in range(reads):
+            started = perf_counter()
+            list(get_feed(readers[0])[:page_size])
+            timings.append(perf_counter() - started)
+        return rows, write_time, mean(timings)
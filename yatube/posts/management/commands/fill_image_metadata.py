@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import caching, images
+from posts.models import Post
+from posts.utils import batches
+
+FIELDS = ['image_width', 'image_height', 'image_placeholder', 'updated']
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры и заглушки картинок постов, загруженных до '
+        'появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='пересчитать и уже заполненные картинки')
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.exclude(image='').only('image', 'group_id')
+        if not options['all']:
+            queryset = queryset.filter(image_width__isnull=True)
+        filled = missing = 0
+        group_ids = set()
+        for batch in batches(queryset, options['batch_size']):
+            now = timezone.now()
+            for post in batch:
+                if images.fill_metadata(post):
+                    filled += 1
+                else:
+                    missing += 1
+                post.image.close()
+                # updated входит в ключ кеша карточки
+                post.updated = now
+                group_ids.add(post.group_id)
+            with transaction.atomic():
+                Post.objects.bulk_update(batch, FIELDS)
+        if filled:
+            caching.bump(
+                caching.INDEX, caching.INDEX_REST, caching.GROUPS,
+                *(caching.group_tag(pk) for pk in group_ids - {None}))
+        self.stdout.write(
+            f'Заполнено картинок: {filled}, не прочитано: {missing}')
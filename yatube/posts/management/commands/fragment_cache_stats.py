@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import (FRAGMENT_NAMES, fragment_stats,
+                           reset_fragment_stats)
+
+
+class Command(BaseCommand):
+    help = 'Показывает долю попаданий в кеш фрагментов шаблонов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*', default=FRAGMENT_NAMES,
+            help='имена фрагментов, по умолчанию все известные')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        self.stdout.write('fragment | hits | misses | hit rate')
+        for name, (hits, misses) in fragment_stats(options['names']).items():
+            total = hits + misses
+            rate = f'{hits / total:.1%}' if total else '-'
+            self.stdout.write(f'{name} | {hits} | {misses} | {rate}')
+        if options['reset']:
+            reset_fragment_stats(options['names'])
@@ -0,0 +1,103 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts import search
+from posts.models import Post
+from posts.utils import batches
+
+
+def since(value):
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise CommandError(f'Неверная дата: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает полнотекстовый индекс постов пачками по id, '
+        'каждая пачка в своей транзакции. С --since переиндексирует только '
+        'посты, измененные после даты, с --verify - только посты, текст '
+        'которых в индексе разошелся с таблицей (после update() и '
+        'bulk_update()). Строки индекса удаленных постов убираются всегда.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--since', type=since,
+            help='дата или дата и время изменения, например 2026-10-01')
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='сверить текст в индексе с постами и исправить расхождения')
+        parser.add_argument(
+            '--optimize', action='store_true',
+            help='слить сегменты индекса после перестроения')
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Полнотекстовый индекс есть только на SQLite')
+        if options['verify']:
+            indexed = self.reindex_stale(options['batch_size'])
+        elif options['since'] is not None:
+            indexed = self.reindex_changed(
+                options['since'], options['batch_size'])
+        else:
+            indexed = self.rebuild(options['batch_size'])
+        if options['verify'] or options['since'] is not None:
+            with transaction.atomic():
+                removed = search.remove_orphans()
+            self.stdout.write(f'Удалено строк индекса: {removed}')
+        if options['optimize']:
+            search.optimize()
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
+
+    def rebuild(self, batch_size):
+        indexed, last_id = 0, 0
+        while True:
+            ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            # последний диапазон открыт справа: заодно удаляются строки
+            # индекса постов с id больше последнего
+            upper = ids[-1] if len(ids) == batch_size else None
+            with transaction.atomic():
+                indexed += search.reindex_range(last_id, upper)
+            if upper is None:
+                return indexed
+            last_id = upper
+
+    def reindex_stale(self, batch_size):
+        indexed, last_id = 0, 0
+        while True:
+            ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return indexed
+            stale = search.stale_ids(last_id, ids[-1])
+            if stale:
+                with transaction.atomic():
+                    search.index_posts(
+                        Post.objects.filter(pk__in=stale).only('text'))
+                indexed += len(stale)
+            last_id = ids[-1]
+
+    def reindex_changed(self, moment, batch_size):
+        indexed = 0
+        queryset = Post.objects.filter(updated__gte=moment).only('text')
+        for batch in batches(queryset, batch_size):
+            with transaction.atomic():
+                search.index_posts(batch)
+            indexed += len(batch)
+        return indexed
@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Follow, Post, UserStats
+from posts.utils import batches
+
+User = get_user_model()
+USER_COUNTERS = ('posts_count', 'followers_count', 'following_count')
+
+
+def count_of(model, field):
+    """Коррелированный подзапрос COUNT(*) по внешнему ключу field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()), 0)
+
+
+def user_counts():
+    return {
+        'posts_count': count_of(Post, 'author'),
+        'followers_count': count_of(Follow, 'author'),
+        'following_count': count_of(Follow, 'user'),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счетчики постов, подписчиков, подписок и комментариев '
+        'с данными и исправляет расхождения пачками.'
+    )
+    # расхождения исправляются не записью посчитанных значений, а
+    # UPDATE с тем же коррелированным подзапросом: счетчик пересчитывается
+    # в момент записи и не затирает инкременты, сделанные после сверки
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать количество расхождений')
+
+    def handle(self, *args, **options):
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+        users = self.reconcile_users(batch_size, dry_run)
+        posts = self.reconcile_posts(batch_size, dry_run)
+        action = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(
+            f'{action} расхождений: пользователи {users}, посты {posts}')
+
+    def reconcile_users(self, batch_size, dry_run):
+        fixed = 0
+        queryset = User.objects.annotate(**{
+            f'actual_{field}': count for field, count in user_counts().items()
+        })
+        for batch in batches(queryset, batch_size):
+            stats = UserStats.objects.in_bulk([user.pk for user in batch])
+            changed, missing = [], []
+            for user in batch:
+                if user.pk not in stats:
+                    missing.append(user.pk)
+                elif any(getattr(stats[user.pk], field)
+                         != getattr(user, f'actual_{field}')
+                         for field in USER_COUNTERS):
+                    changed.append(user.pk)
+            fixed += len(changed) + len(missing)
+            if not dry_run and (changed or missing):
+                with transaction.atomic():
+                    UserStats.objects.bulk_create(
+                        [UserStats(user_id=pk) for pk in missing],
+                        ignore_conflicts=True)
+                    UserStats.objects.filter(
+                        pk__in=changed + missing).update(**user_counts())
+        return fixed
+
+    def reconcile_posts(self, batch_size, dry_run):
+        fixed = 0
+        queryset = Post.objects.only('pk', 'comments_count').annotate(
+            actual_comments_count=count_of(Comment, 'post'))
+        for batch in batches(queryset, batch_size):
+            changed = [post.pk for post in batch
+                       if post.comments_count != post.actual_comments_count]
+            fixed += len(changed)
+            if not dry_run and changed:
+                Post.objects.filter(pk__in=changed).update(
+                    comments_count=count_of(Comment, 'post'))
+        return fixed
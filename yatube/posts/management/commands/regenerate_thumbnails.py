@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры всех вариантов settings.POST_IMAGES для картинок '
+        'постов в несколько процессов. Готовые миниатюры пропускаются, а '
+        'новая геометрия или обрезка дают новые имена файлов, поэтому '
+        'смену варианта выкатывают так: добавить вариант в POST_IMAGES, '
+        'прогнать команду с --alias, затем переключить шаблоны. Прерванный '
+        'запуск продолжается с сохраненной позиции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--alias', action='append', dest='aliases',
+            help='вариант из POST_IMAGES, можно повторять; по умолчанию все')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='число процессов; 1 - без пула, в текущем процессе')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='не больше стольких картинок в секунду, 0 - без ограничения')
+        parser.add_argument(
+            '--checkpoint', default='regenerate_thumbnails.json',
+            help='файл с позицией для продолжения прерванного запуска')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='начать сначала, не читая позицию')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or list(settings.POST_IMAGES)
+        unknown = set(aliases) - set(settings.POST_IMAGES)
+        if unknown:
+            raise CommandError(
+                f'Нет в POST_IMAGES: {", ".join(sorted(unknown))}')
+        self.checkpoint = options['checkpoint']
+        state = {'last_id': 0, 'built': 0, 'failed': 0}
+        if not options['restart'] and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as checkpoint:
+                state.update(json.load(checkpoint))
+            self.stdout.write(f'Продолжение после поста {state["last_id"]}')
+        queryset = Post.objects.exclude(image='').only('image')
+        total = queryset.filter(pk__gt=state['last_id']).count()
+        build = partial(thumbnails.build, aliases=aliases)
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            self.run(map, build, queryset, state, total, options)
+            return
+        # дочерние процессы не должны делить соединения с базой родителя
+        connections.close_all()
+        with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup) as pool:
+            self.run(pool.map, build, queryset, state, total, options)
+
+    def run(self, map_, build, queryset, state, total, options):
+        started, done, images = time.monotonic(), 0, 0
+        batch_queryset = queryset.filter(pk__gt=state['last_id'])
+        for batch in batches(batch_queryset, options['batch_size']):
+            # общий файл нескольких постов обрабатывается один раз
+            names = list(dict.fromkeys(post.image.name for post in batch))
+            for name, ok in zip(names, map_(build, names)):
+                if ok:
+                    state['built'] += 1
+                else:
+                    state['failed'] += 1
+                    self.stderr.write(f'Не удалось: {name}')
+            done += len(batch)
+            images += len(names)
+            state['last_id'] = batch[-1].pk
+            self.save_checkpoint(state)
+            if options['rate']:
+                self.throttle(started, images, options['rate'])
+            self.progress(done, total, time.monotonic() - started, state)
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.stdout.write(
+            f'Готово картинок: {state["built"]}, '
+            f'ошибок: {state["failed"]}')
+
+    def throttle(self, started, images, rate):
+        # темп считается с начала запуска, пачки не обязаны быть ровными
+        ahead = images / rate - (time.monotonic() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def save_checkpoint(self, state):
+        # запись через временный файл: прерывание не портит позицию
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(temporary, self.checkpoint)
+
+    def progress(self, done, total, elapsed, state):
+        speed = done / elapsed if elapsed else 0
+        left = (total - done) / speed if speed else 0
+        self.stdout.write(
+            f'Постов: {done} из {total}, картинок: {state["built"]}, '
+            f'ошибок: {state["failed"]}, {speed:.1f}/с, '
+            f'осталось ~{left:.0f} с')
@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from posts import caching
+from posts.models import Post
+from posts.storage import (content_directory, content_hash, content_name,
+                           is_content_addressed)
+from posts.utils import batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище с адресацией по содержимому '
+        'и переписывает пути Post.image пачками. Одинаковые картинки '
+        'сливаются в один файл.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только посчитать, какие пути изменятся')
+        parser.add_argument(
+            '--delete-old', action='store_true',
+            help='удалять старые файлы, на которые больше нет ссылок')
+
+    def handle(self, *args, **options):
+        if not settings.CONTENT_ADDRESSED_UPLOADS:
+            raise CommandError('Настройка CONTENT_ADDRESSED_UPLOADS пуста')
+        dry_run = options['dry_run']
+        self.moved = self.missing = 0
+        self.group_ids = set()
+        queryset = Post.objects.exclude(image='').only(
+            'image', 'group_id')
+        for batch in batches(queryset, options['batch_size']):
+            changed = self.rehash(batch, dry_run)
+            if dry_run or not changed:
+                continue
+            now = timezone.now()
+            with transaction.atomic():
+                for post, _ in changed:
+                    # updated входит в ключ кеша карточки
+                    post.updated = now
+                Post.objects.bulk_update(
+                    [post for post, _ in changed], ['image', 'updated'])
+            if options['delete_old']:
+                self.delete_unused({old for _, old in changed})
+        if not dry_run and self.moved:
+            caching.bump(
+                caching.INDEX, caching.INDEX_REST, caching.GROUPS,
+                *(caching.group_tag(pk) for pk in self.group_ids))
+        action = 'Будет перенесено' if dry_run else 'Перенесено'
+        self.stdout.write(
+            f'{action} картинок: {self.moved}, '
+            f'нет файла: {self.missing}')
+
+    def rehash(self, batch, dry_run):
+        changed = []
+        for post in batch:
+            old = post.image.name
+            directory = content_directory(old)
+            if directory is None or is_content_addressed(old):
+                continue
+            if not default_storage.exists(old):
+                self.missing += 1
+                continue
+            with default_storage.open(old) as content:
+                new = content_name(
+                    directory, content_hash(content),
+                    os.path.splitext(old)[1])
+                if not dry_run and not default_storage.exists(new):
+                    default_storage.save(new, content)
+            post.image.name = new
+            changed.append((post, old))
+            self.group_ids.add(post.group_id)
+            self.moved += 1
+        return changed
+
+    def delete_unused(self, names):
+        used = set(Post.objects.filter(image__in=names).values_list(
+            'image', flat=True))
+        for name in names - used:
+            default_storage.delete(name)
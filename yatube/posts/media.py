@@ -0,0 +1,145 @@
+"""Отдача загруженных файлов без чтения их в память Python.
+
+Без прокси файл отдается FileResponse: WSGI-сервер с wsgi.file_wrapper
+(gunicorn, uWSGI) передает его через sendfile. С прокси
+settings.MEDIA_SENDFILE = 'x-accel' (nginx) или 'x-sendfile' (Apache,
+lighttpd) передает отдачу ему, Django только проверяет путь и ставит
+заголовки. Поддерживаются условные запросы (ETag, Last-Modified) и
+один диапазон Range; несколько диапазонов отдаются целым файлом.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Файл, читаемый только до конца диапазона.
+
+    Без fileno(), чтобы file_wrapper не отдал через sendfile весь
+    хвост файла.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(начало, длина) одного диапазона, None - отдать файл целиком.
+
+    ValueError, если диапазон вне файла.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500 - последние 500 байт
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def range_applies(request, etag, last_modified):
+    """If-Range: диапазон действует, только если файл не изменился."""
+    condition = request.META.get('HTTP_IF_RANGE')
+    if not condition:
+        return True
+    if condition.startswith(('"', 'W/')):
+        return condition == etag
+    return (last_modified is not None
+            and parse_http_date_safe(condition) == last_modified)
+
+
+def file_response(request, path, accel_path=None, max_age=None, etag=None,
+                  immutable=False):
+    """Ответ с файлом по абсолютному пути path.
+
+    accel_path - путь для X-Accel-Redirect, если файл отдает прокси.
+    etag задают файлам, чей mtime не означает изменения содержимого;
+    Last-Modified у них не выводится. immutable ставят только файлам,
+    чье имя не может достаться другому содержимому. FileNotFoundError,
+    если файла нет.
+    """
+    status = os.stat(path)
+    if not stat.S_ISREG(status.st_mode):
+        raise FileNotFoundError(path)
+    size = status.st_size
+    last_modified = None
+    if etag is None:
+        last_modified = int(status.st_mtime)
+        etag = f'{status.st_mtime_ns:x}-{size:x}'
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag, last_modified)
+    if response is None:
+        response = send(request, path, accel_path, size, etag, last_modified)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if max_age is None:
+        max_age = settings.MEDIA_REVALIDATE_MAX_AGE
+    cache_control = {'public': True, 'max_age': max_age}
+    if immutable:
+        cache_control['immutable'] = True
+    patch_cache_control(response, **cache_control)
+    return response
+
+
+def send(request, path, accel_path, size, etag, last_modified):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile == 'x-accel' and accel_path:
+        # Range и отдачу тела берет на себя nginx
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_path
+        return response
+    if sendfile == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and range_applies(
+            request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            RangeFile(file, start, length), content_type=content_type,
+            status=206)
+        response['Content-Length'] = length
+        response['Content-Range'] = (
+            f'bytes {start}-{start + length - 1}/{size}')
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -1,5 +1,8 @@
+from collections import Counter
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Substr
 
 from .validators import validate_not_empty
 
@@ -26,7 +29,71 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class AtomicSaveModel(models.Model):
+    """Сохраняет объект в одной транзакции с обработчиками post_save.
+
+    Денормализованные счетчики обновляются сигналами и должны
+    фиксироваться или откатываться вместе с самой записью.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+# сколько символов последнего комментария карточка берет из базы
+LATEST_COMMENT_LENGTH = 200
+
+
+class PostQuerySet(models.QuerySet):
+    def with_latest_comment(self):
+        """Последний комментарий к каждому посту в том же запросе.
+
+        Добавляет latest_comment_id, latest_comment_text (начало текста) и
+        latest_comment_author. Подзапросы берут одну строку по индексу
+        (post, -created, -id), количество комментариев хранит
+        comments_count.
+        """
+        latest = Comment.objects.filter(
+            post=models.OuterRef('pk')).order_by('-created', '-pk')[:1]
+        return self.annotate(
+            latest_comment_id=models.Subquery(latest.values('pk')),
+            latest_comment_text=models.Subquery(latest.annotate(
+                snippet=Substr('text', 1, LATEST_COMMENT_LENGTH)).values(
+                    'snippet')),
+            latest_comment_author=models.Subquery(
+                latest.values('author__username')))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create не отправляет post_save, поэтому ленты подписчиков,
+        # счетчики и поисковый индекс дополняем вручную
+        from .counters import bump_user
+        from .feed import push_bulk_posts
+        from .search import index_new_posts
+        from .utils import invalidate_post_counts
+
+        with transaction.atomic():
+            last_id = self.model._base_manager.aggregate(
+                last_id=models.Max('pk'))['last_id'] or 0
+            objs = super().bulk_create(objs, *args, **kwargs)
+            push_bulk_posts(objs)
+            index_new_posts(last_id)
+            authors = Counter(post.author_id for post in objs)
+            for author_id, posts_count in authors.items():
+                bump_user(author_id, posts_count=posts_count)
+        for post in objs:
+            invalidate_post_counts(post)
+        return objs
+
+
+class Post(AtomicSaveModel):
     text = models.TextField(
         verbose_name="Текст поста",
         validators=[validate_not_empty],
@@ -53,17 +120,52 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
         help_text='Загрузите картинку к посту')
+    # заполняются при сохранении картинки, см. posts.images
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False)
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        blank=True,
+        null=True,
+        editable=False)
+    image_placeholder = models.TextField(
+        verbose_name='Заглушка картинки',
+        blank=True,
+        editable=False)
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False)
+    # входит в ключ кеша отрисованной карточки поста
+    updated = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-pk")
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        indexes = [
+            models.Index(
+                name="post_author_pub_date_idx",
+                fields=["author", "-pub_date"],
+            ),
+            models.Index(
+                name="post_group_pub_date_idx",
+                fields=["group", "-pub_date"],
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -87,12 +189,18 @@ class Comment(models.Model):
         ordering = ("-created",)
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        indexes = [
+            models.Index(
+                name="comment_post_created_idx",
+                fields=["post", "-created", "-id"],
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveModel):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -121,3 +229,63 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class FeedItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Читатель ленты')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пост')
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста')
+
+    class Meta:
+        ordering = ("-pub_date",)
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты подписок"
+        constraints = [
+            models.UniqueConstraint(
+                name="unique_feed_item",
+                fields=["user", "post"],
+            ),
+        ]
+        indexes = [
+            models.Index(
+                name="feed_user_pub_date_idx",
+                fields=["user", "-pub_date", "-post"],
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0)
+
+    class Meta:
+        verbose_name = "Счетчики пользователя"
+        verbose_name_plural = "Счетчики пользователей"
+
+    def __str__(self):
+        return f'Счетчики {self.user}'
@@ -0,0 +1,136 @@
+"""Картинки постов произвольного размера по подписанному адресу.
+
+/img/<w>x<h>/<путь>?s=<подпись> отдает исходник Post.image, обрезанный
+по центру до w x h. Подпись ставит сервер (resized_url, тег
+resized_image), поэтому размеры не перебираются извне. Результаты
+лежат в settings.IMAGE_RESIZE_ROOT, общий объем ограничен
+IMAGE_RESIZE_CACHE_SIZE: при переполнении удаляются файлы, к которым
+дольше всех не обращались (время доступа - mtime файла).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps
+
+from .storage import is_content_addressed
+from .uploads import SAVE_OPTIONS
+
+SALT = 'posts.resize'
+# после вытеснения кеш занимает не больше этой доли лимита, чтобы не
+# обходить каталог на каждой записи
+LOW_WATERMARK = 0.9
+
+_lock = threading.Lock()
+# объем кеша по оценке этого процесса, None - еще не считали
+_cache_size = None
+
+
+def signature(width, height, name):
+    return salted_hmac(SALT, f'{width}x{height}/{name}').hexdigest()[:16]
+
+
+def check_signature(width, height, name, value):
+    return constant_time_compare(signature(width, height, name), value or '')
+
+
+def resized_url(name, width, height):
+    url = reverse('posts:resized_image', args=(width, height, name))
+    return f'{url}?s={signature(width, height, name)}'
+
+
+def source_version(name):
+    """Версия исходника для ключа кеша и ETag.
+
+    Имя по хешу содержимого само задает содержимое, версия пустая.
+    Обычное имя после сборки мусора или перехеширования может достаться
+    другому файлу, поэтому в версию входят время изменения и размер.
+    """
+    if is_content_addressed(name):
+        return ''
+    modified = default_storage.get_modified_time(name)
+    size = default_storage.size(name)
+    return f'{int(modified.timestamp() * 10 ** 6):x}-{size:x}'
+
+
+def cache_path(name, width, height, version=''):
+    digest = hashlib.sha1(
+        f'{width}x{height}/{name}/{version}'.encode()).hexdigest()
+    return os.path.join(settings.IMAGE_RESIZE_ROOT, digest[:2], digest)
+
+
+def resized(name, width, height, version=''):
+    """Путь к файлу в кеше с уменьшенной копией исходника.
+
+    version - source_version(name).
+    """
+    path = cache_path(name, width, height, version)
+    for image_format in ('JPEG', 'PNG'):
+        candidate = f'{path}.{image_format.lower()}'
+        try:
+            # обращение продлевает жизнь файла в LRU
+            os.utime(candidate)
+        except FileNotFoundError:
+            continue
+        return candidate
+    with default_storage.open(name) as source, Image.open(source) as image:
+        image.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image_format = 'PNG' if 'A' in image.getbands() else 'JPEG'
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    path = f'{path}.{image_format.lower()}'
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # другой процесс может писать тот же файл: запись через временный
+    handle, temporary = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as output:
+        image.save(output, image_format, **SAVE_OPTIONS[image_format])
+    os.replace(temporary, path)
+    add_to_cache(os.path.getsize(path))
+    return path
+
+
+def cache_files():
+    for directory in os.scandir(settings.IMAGE_RESIZE_ROOT):
+        if directory.is_dir():
+            yield from (entry for entry in os.scandir(directory.path)
+                        if entry.is_file())
+
+
+def add_to_cache(size):
+    global _cache_size
+    with _lock:
+        if _cache_size is None:
+            _cache_size = sum(entry.stat().st_size
+                              for entry in cache_files())
+        else:
+            _cache_size += size
+        if _cache_size > settings.IMAGE_RESIZE_CACHE_SIZE:
+            _cache_size = evict(
+                settings.IMAGE_RESIZE_CACHE_SIZE * LOW_WATERMARK)
+
+
+def evict(target):
+    """Удаляет самые давние файлы кеша до объема target, возвращает объем.
+
+    Размер пересчитывается по диску: оценки процессов расходятся.
+    """
+    entries = sorted(
+        ((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+         for entry in cache_files()), reverse=True)
+    total = sum(size for _, size, _ in entries)
+    while entries and total > target:
+        _, size, path = entries.pop()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
@@ -0,0 +1,194 @@
+"""Полнотекстовый поиск по тексту постов на SQLite FTS5.
+
+Индекс - виртуальная таблица posts_post_fts с rowid, равным id поста.
+Ее создает миграция, а сигналы поддерживают в актуальном состоянии;
+queryset.update() и bulk_update() сигналов не отправляют, расхождения
+исправляет команда rebuild_search_index (--verify сверяет текст в
+индексе с таблицей постов). На других СУБД поиск деградирует до
+icontains с курсором по id.
+"""
+import base64
+import binascii
+import math
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .utils import parse_id
+
+TABLE = 'posts_post_fts'
+# маркеры подсветки заменяются на <mark> уже после экранирования текста
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 32
+TERM_RE = re.compile(r'\w+')
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова, по префиксу.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 в вводе не работают
+    и не вызывают синтаксических ошибок. Префиксный поиск отчасти
+    заменяет отсутствующий стемминг для русского языка.
+    """
+    terms = TERM_RE.findall(text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_posts(posts):
+    if not available():
+        return
+    posts = list(posts)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [(post.pk,) for post in posts])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [(post.pk, post.text) for post in posts])
+
+
+def unindex_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def reindex_range(first_id, last_id=None):
+    """Переиндексирует посты first_id < id <= last_id одной командой.
+
+    Строки индекса удаленных постов из диапазона исчезают заодно.
+    """
+    condition, params = '{column} > %s', [first_id]
+    if last_id is not None:
+        condition += ' AND {column} <= %s'
+        params.append(last_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE '
+            + condition.format(column='rowid'), params)
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text) '
+            f'SELECT id, text FROM posts_post WHERE '
+            + condition.format(column='id'), params)
+        return cursor.rowcount
+
+
+def remove_orphans():
+    """Удаляет строки индекса постов, которых больше нет."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} '
+            f'WHERE rowid NOT IN (SELECT id FROM posts_post)')
+        return cursor.rowcount
+
+
+def stale_ids(first_id, last_id=None):
+    """Id постов first_id < id <= last_id, текст которых в индексе
+    отсутствует или отличается от текста поста."""
+    sql = (f'SELECT p.id FROM posts_post p '
+           f'LEFT JOIN {TABLE} f ON f.rowid = p.id '
+           f'WHERE p.id > %s AND (f.rowid IS NULL OR f.text IS NOT p.text)')
+    params = [first_id]
+    if last_id is not None:
+        sql += ' AND p.id <= %s'
+        params.append(last_id)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [post_id for post_id, in cursor.fetchall()]
+
+
+def index_new_posts(last_id):
+    """Индексирует посты, добавленные после last_id, например bulk_create.
+
+    Первичные ключи после bulk_create известны не на всех СУБД.
+    """
+    if available():
+        reindex_range(last_id)
+
+
+def optimize():
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def matching_ids_sql(text):
+    """SQL и параметры подзапроса id постов, подходящих под запрос."""
+    return (f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+            [match_query(text)])
+
+
+def encode_cursor(rank, post_id):
+    """Позиция в выдаче: (rank, id) последнего показанного поста."""
+    raw = f'{rank!r}|{post_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, post_id = raw.decode().split('|')
+        rank, post_id = float(rank), parse_id(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if post_id is None or not math.isfinite(rank):
+        return None
+    return rank, post_id
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(
+        MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search(text, post_list, limit, cursor=None):
+    """Посты по релевантности (bm25), страница после курсора.
+
+    Возвращает (посты, курсор следующей страницы или None). У постов
+    заполнены rank и snippet - фрагмент текста с подсвеченными словами.
+    """
+    query = match_query(text)
+    if not query:
+        return [], None
+    position = decode_cursor(cursor)
+    if not available():
+        post_list = post_list.filter(text__icontains=text).order_by('-pk')
+        if position is not None:
+            post_list = post_list.filter(pk__lt=position[1])
+        posts = list(post_list[:limit + 1])
+        if len(posts) <= limit:
+            return posts, None
+        return posts[:limit], encode_cursor(0.0, posts[limit - 1].pk)
+    sql = (f'SELECT rowid, rank, snippet({TABLE}, 0, %s, %s, %s, %s) '
+           f'FROM {TABLE} WHERE {TABLE} MATCH %s')
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, query]
+    if position is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid < %s))'
+        params += [position[0], position[0], position[1]]
+    sql += ' ORDER BY rank, rowid DESC LIMIT %s'
+    params.append(limit + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    found = post_list.in_bulk([post_id for post_id, _, _ in rows])
+    posts = []
+    for post_id, rank, snippet in rows:
+        # индекс может ненадолго пережить пост или не пройти фильтр
+        post = found.get(post_id)
+        if post is not None:
+            post.rank, post.snippet = rank, highlight(snippet)
+            posts.append(post)
+    next_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return posts, next_cursor
@@ -0,0 +1,180 @@
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, counters, feed, images, search, thumbnails
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .utils import invalidate_post_counts
+
+# обработчики счетчиков подключаются первыми: лента подписок опирается
+# на актуальное число подписчиков автора
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    # при редактировании пост может перейти в другую группу или получить
+    # новую картинку
+    instance._old_group_id = instance._old_image = None
+    if instance.pk is not None and not raw:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image').first()
+        if old is not None:
+            instance._old_group_id, instance._old_image = old
+
+
+@receiver(pre_save, sender=Post)
+def fill_image_metadata(sender, instance, raw=False, **kwargs):
+    # новая загрузка еще в памяти или во временном файле, повторно
+    # исходник не открывается
+    if not raw and instance.image.name != instance._old_image:
+        images.fill_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_feeds(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_counts(sender, instance, created, raw=False,
+                                 **kwargs):
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if created or old_group_id != instance.group_id:
+        invalidate_post_counts(instance, old_group_id)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_counts(sender, instance, **kwargs):
+    invalidate_post_counts(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_follower_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_follower_feed(sender, instance, **kwargs):
+    feed.unfollow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_fragments(sender, instance, created, raw=False,
+                                    **kwargs):
+    if created:
+        caching.bump_index()
+    else:
+        caching.bump_index_post(instance)
+    caching.bump_post_tags(
+        instance, getattr(instance, '_old_group_id', None))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_readers(sender, instance, **kwargs):
+    # записи лент удаляются каскадом раньше, чем придет post_delete
+    instance._feed_readers = list(caching.feed_readers(instance))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_fragments(sender, instance, **kwargs):
+    caching.bump_index()
+    caching.bump_post_tags(
+        instance, readers=getattr(instance, '_feed_readers', None))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        caching.bump_index_post(post)
+        caching.bump_post_tags(post)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_fragments(sender, instance, **kwargs):
+    caching.bump_index()
+    caching.bump(caching.GROUPS, caching.group_tag(instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_fragments(sender, instance, **kwargs):
+    caching.bump(
+        caching.feed_tag(instance.user_id),
+        caching.follows_tag(instance.user_id),
+        caching.follows_tag(instance.author_id))
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, **kwargs):
+    search.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def schedule_post_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image.name != getattr(
+            instance, '_old_image', None):
+        thumbnails.schedule(instance.image)
+
+
+@receiver(request_started)
+def collect_deferred_work(sender, **kwargs):
+    thumbnails.start_request()
+    feed.start_request()
+
+
+@receiver(request_finished)
+def run_deferred_work(sender, **kwargs):
+    thumbnails.finish_request()
+    feed.finish_request()
@@ -0,0 +1,112 @@
+"""Статика с хешем содержимого в имени и заранее сжатыми копиями.
+
+collectstatic пишет файлы под именами с хешем и манифест
+(ManifestStaticFilesStorage), а рядом с текстовыми файлами - копии .gz и
+.br (brotli - если установлен пакет brotli). static_file выбирает копию
+по Accept-Encoding; имена с хешем не меняются вместе с содержимым,
+поэтому кешируются браузером на год как immutable.
+"""
+import gzip
+import os
+import re
+
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.xml',
+                '.html', '.map')
+# расширение копии и Content-Encoding в порядке предпочтения
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+Q_RE = re.compile(r';\s*q=([0-9.]+)')
+# хеш, который ManifestStaticFilesStorage вставляет перед расширением
+HASH_RE = re.compile(r'\.[0-9a-f]{12}(?=\.[^./]+$)')
+
+
+def compress_gzip(data):
+    # mtime=0: одинаковые файлы дают одинаковые архивы
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compressors():
+    yield '.gz', compress_gzip
+    if brotli is not None:
+        yield '.br', brotli.compress
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест с хешами и сжатые копии файлов с хешем в имени.
+
+    Без манифеста (collectstatic не запускали, например в тестах)
+    {% static %} выводит исходное имя вместо ошибки.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            with self.open(name) as original:
+                data = original.read()
+            for extension, compress in compressors():
+                compressed = compress(data)
+                # копия, которая не меньше оригинала, не нужна
+                if len(compressed) < len(data):
+                    self.write_compressed(name + extension, compressed)
+                    yield name, name + extension, True
+
+    def write_compressed(self, name, content):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as output:
+            output.write(content)
+
+
+def quality(part):
+    """q из элемента Accept-Encoding; испорченное значение считается 1."""
+    match = Q_RE.search(part)
+    if match is None:
+        return 1
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return 1
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме отключенных через q=0."""
+    accepted = set()
+    for part in header.split(','):
+        token = part.split(';')[0].strip().lower()
+        if token and quality(part) != 0:
+            accepted.add(token)
+    return accepted
+
+
+def is_hashed(name):
+    """Имя с хешем из манифеста: содержимое по нему не меняется."""
+    original = HASH_RE.sub('', name, count=1)
+    return original != name and staticfiles_storage.stored_name(
+        original) == name
+
+
+def negotiate(path, accept_encoding):
+    """(путь к лучшей копии, Content-Encoding или None)."""
+    accepted = accepted_encodings(accept_encoding)
+    for extension, encoding in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + extension):
+            return path + extension, encoding
+    return path, None
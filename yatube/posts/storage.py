@@ -0,0 +1,71 @@
+"""Хранилище загрузок с адресацией по содержимому.
+
+Файлы из каталогов settings.CONTENT_ADDRESSED_UPLOADS сохраняются под
+именем sha256 содержимого и раскладываются по вложенным каталогам:
+posts/3a/7f/3a7f...e1.jpg. Повторная загрузка той же картинки не
+пишет второй копии, посты ссылаются на один файл. Файлы остальных
+каталогов (миниатюры sorl и т.п.) сохраняются как обычно.
+
+Общий файл нельзя удалять вместе с одним постом; неиспользуемые файлы
+удаляет команда collect_media_garbage.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """sha256 файла, читаемого кусками, с возвратом в начало."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(directory, digest, extension):
+    """posts/ + каталоги по первым символам хеша + хеш.расширение."""
+    shards, start = [], 0
+    for width in settings.CONTENT_ADDRESSED_SHARDS:
+        shards.append(digest[start:start + width])
+        start += width
+    return '/'.join(
+        [directory.rstrip('/'), *shards, digest + extension.lower()])
+
+
+def content_directory(name):
+    """Каталог адресации по содержимому, к которому относится имя."""
+    for directory in settings.CONTENT_ADDRESSED_UPLOADS:
+        if name.startswith(directory):
+            return directory
+    return None
+
+
+def is_content_addressed(name):
+    directory = content_directory(name)
+    if directory is None:
+        return False
+    digest, _ = os.path.splitext(os.path.basename(name))
+    return name == content_name(directory, digest, os.path.splitext(name)[1])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        directory = content_directory(name)
+        if directory is None:
+            return super()._save(name, content)
+        name = content_name(
+            directory, content_hash(content), os.path.splitext(name)[1])
+        if self.exists(name):
+            # свежий mtime защищает файл от сборщика мусора, пока пост
+            # с новой ссылкой на него не сохранен
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
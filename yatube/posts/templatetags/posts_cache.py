@@ -0,0 +1,93 @@
+from django import template
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from ..caching import GROUPS, card_key, generation, record_fragment
+from ..thumbnails import PENDING_MARKER, prefetch_pictures
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        expire_time = self.expire_time.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        try:
+            fragment_cache = caches['template_fragments']
+        except InvalidCacheBackendError:
+            fragment_cache = caches['default']
+        cache_key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on])
+        value = fragment_cache.get(cache_key)
+        record_fragment(self.fragment_name, value is not None)
+        if value is None:
+            value = self.nodelist.render(context)
+            # заглушки миниатюр не кешируем: картинка вот-вот появится
+            if PENDING_MARKER not in value:
+                fragment_cache.set(cache_key, value, expire_time)
+        return value
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """Как {% cache %}, но считает попадания и промахи по имени фрагмента.
+
+        {% fragment_cache timeout name [vary_on ...] %}
+            ...
+        {% endfragment_cache %}
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 2 arguments.")
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]])
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Отрисованные карточки постов страницы из кеша одним get_many.
+
+        {% post_cards page_obj as cards %}
+
+    Вариант карточки зависит от того, выводится ли она на странице
+    автора (author) или группы (group) - там скрыты ссылки на них же.
+    """
+    author, group = bool(context.get('author')), bool(context.get('group'))
+    variant = f'{int(author)}{int(group)}'
+    posts = list(posts)
+    groups_generation = generation(GROUPS)
+    keys = [card_key(post, variant, groups_generation) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    prefetch_pictures(
+        [post for post, key in zip(posts, keys) if key not in cards], 'card')
+    for post, key in zip(posts, keys):
+        if key not in cards:
+            missing[key] = render_to_string(CARD_TEMPLATE, {
+                'post': post, 'author': author, 'group': group})
+    cache.set_many({key: card for key, card in missing.items()
+                    if PENDING_MARKER not in card},
+                   settings.CARD_CACHE_TIMEOUT)
+    cards.update(missing)
+    record_fragment('post_card', True, len(posts) - len(missing))
+    record_fragment('post_card', False, len(missing))
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,69 @@
+from django import template
+from sorl.thumbnail.templatetags.thumbnail import ThumbnailNodeBase
+
+from .. import resize, thumbnails
+
+register = template.Library()
+
+
+class PostThumbnailNode(ThumbnailNodeBase):
+    child_nodelists = ('nodelist_file', 'nodelist_empty')
+
+    def __init__(self, image, alias, as_var, nodelist_file, nodelist_empty):
+        self.image = image
+        self.alias = alias
+        self.as_var = as_var
+        self.nodelist_file = nodelist_file
+        self.nodelist_empty = nodelist_empty
+
+    def _render(self, context):
+        image = self.image.resolve(context)
+        if not image:
+            return ''
+        alias = self.alias.resolve(context)
+        picture = thumbnails.cached_picture(image, alias)
+        with context.push():
+            if picture is not None:
+                context[self.as_var] = picture
+                return self.nodelist_file.render(context)
+            thumbnails.schedule(image)
+            width, height = thumbnails.dimensions(alias, image.instance)
+            context[self.as_var] = {'width': width, 'height': height}
+            return self.nodelist_empty.render(context)
+
+
+@register.tag('post_thumbnail')
+def do_post_thumbnail(parser, token):
+    """Готовые миниатюры картинки поста или заглушка, пока их строят.
+
+        {% post_thumbnail post.image 'card' as im %}
+            <img src="{{ im.src }}" srcset="{{ im.fallback_srcset }}">
+        {% empty %}
+            заглушка с пропорциями {{ im.width }}x{{ im.height }}
+        {% endpost_thumbnail %}
+
+    Варианты описаны в settings.POST_IMAGES, im - thumbnails.Picture.
+    """
+    bits = token.split_contents()
+    if len(bits) != 5 or bits[3] != 'as':
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag expects: image alias as var")
+    nodelist_file = parser.parse(('empty', 'endpost_thumbnail'))
+    nodelist_empty = template.NodeList()
+    if parser.next_token().contents == 'empty':
+        nodelist_empty = parser.parse(('endpost_thumbnail',))
+        parser.delete_first_token()
+    return PostThumbnailNode(
+        parser.compile_filter(bits[1]), parser.compile_filter(bits[2]),
+        bits[4], nodelist_file, nodelist_empty)
+
+
+@register.simple_tag
+def resized_image(image, width, height):
+    """Подписанный адрес картинки, обрезанной до width x height.
+
+        <img src="{% resized_image post.image 640 480 %}">
+    """
+    if not image:
+        return ''
+    return resize.resized_url(image.name, width, height)
@@ -0,0 +1,29 @@
+from django import template
+
+from ..utils import END_POSITION, encode_cursor, encode_position
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page):
+    """Курсор для ссылки ?after= на следующую страницу."""
+    return encode_cursor(page[-1])
+
+
+@register.filter
+def previous_cursor(page):
+    """Курсор для ссылки ?before= на предыдущую страницу."""
+    return encode_cursor(page[0])
+
+
+@register.filter
+def page_window(page):
+    """Номера страниц для ссылок: только окно вокруг текущей."""
+    return page.paginator.page_window(page.number)
+
+
+@register.simple_tag
+def end_cursor():
+    """Курсор для ссылки ?before= на последнюю страницу."""
+    return encode_position(*END_POSITION)
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post
+
+User = get_user_model()
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        cls.author = User.objects.create_user(username='Voldemort')
+        cls.follower = User.objects.create_user(username='HarryPotter')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        return self.client.get(
+            reverse(f'admin:posts_{model._meta.model_name}_changelist'),
+            params)
+
+    def test_admin_keyset_browsing(self):
+        """список постов листается по id без повторов и пропусков"""
+        posts = [Post.objects.create(author=self.author, text=f'Пост {n}')
+                 for n in range(5)]
+        found, params = [], {}
+        with mock.patch.object(site._registry[Post], 'list_per_page', 2):
+            while True:
+                changelist = self.changelist(Post, **params).context['cl']
+                found += list(changelist.result_list)
+                if changelist.next_after is None:
+                    break
+                params = {'after': changelist.next_after}
+        self.assertEqual(found, posts[::-1])
+
+    def test_admin_after_out_of_range(self):
+        """id за пределами INTEGER в ?after= открывает первую страницу"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        response = self.changelist(Post, after='9' * 30)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+
+    def test_admin_input_filters(self):
+        """фильтры по username и id поста работают без списков"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.follower, text='Другой пост')
+        comment = Comment.objects.create(
+            post=post, author=self.follower, text='Комментарий')
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        cases = (
+            (Post, {'author': self.author.username}, [post]),
+            (Comment, {'post': post.pk}, [comment]),
+            (Comment, {'post': 'abc'}, []),
+            (Follow, {'user': self.follower.username}, [follow]),
+            (Follow, {'author': self.follower.username}, []),
+        )
+        for model, params, expected in cases:
+            with self.subTest(model=model, params=params):
+                response = self.changelist(model, **params)
+                self.assertEqual(
+                    list(response.context['cl'].result_list), expected)
+
+    def test_admin_changelist_queries(self):
+        """число запросов списка не зависит от числа строк"""
+        for number in range(3):
+            post = Post.objects.create(author=self.author, text='Пост')
+            Comment.objects.create(
+                post=post, author=self.follower, text='Комментарий')
+        self.changelist(Comment)
+        with self.assertNumQueries(5):
+            self.changelist(Comment)
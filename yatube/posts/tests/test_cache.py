@@ -1,9 +1,14 @@
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 
-from ..models import Group, Post
+from ..caching import fragment_stats
+from ..models import Follow, Group, Post
 
 User = get_user_model()
 
@@ -14,13 +19,16 @@ class CacheTests(TestCase):
         super().setUpClass()
         cls.user = User.objects.create_user(username='Voldemort')
 
+    def setUp(self):
+        cache.clear()
+
     def test_cache_index(self):
         """проверяем работу кеша для страницы index"""
         group = Group.objects.create(
             title='Тестовая группа',
             slug='test-group',
             description='Тестовая группа 1 для проверки')
-        Post.objects.create(
+        post = Post.objects.create(
             author=self.user,
             group=group,
             text='Тестовый пост' * 30,)
@@ -28,14 +36,112 @@ class CacheTests(TestCase):
         self.assertEqual(
             len(first_response.context['page_obj']), 1,
             'пост для тестирования не создан')
-        Post.objects.all().delete()
+        # update() не отправляет сигналы, поэтому фрагмент остается в кеше
+        Post.objects.filter(pk=post.pk).update(text='Измененный пост')
         cached_response = self.client.get(reverse('posts:index'))
         self.assertEqual(
             cached_response.content, first_response.content,
-            'контента в кеше не сохранился после удаления поста')
-        cache.clear()
+            'контент не сохранился в кеше')
 
-        clear_cache_response = self.client.get(reverse('posts:index'))
+        Post.objects.all().delete()
+        deleted_response = self.client.get(reverse('posts:index'))
         self.assertNotEqual(
-            cached_response.content, clear_cache_response.content,
-            'конттент не изменился после очистки кеша')
+            cached_response.content, deleted_response.content,
+            'контент не изменился после удаления поста')
+        Post.objects.create(author=self.user, text='Новый пост')
+        created_response = self.client.get(reverse('posts:index'))
+        self.assertContains(created_response, 'Новый пост')
+
+    def test_cache_index_page_invalidation(self):
+        """правка поста сбрасывает только страницу index с этим постом"""
+        posts = [Post.objects.create(author=self.user, text=f'Пост {number}')
+                 for number in range(settings.POSTS_ON_PAGE + 1)]
+        first_page_post, second_page_post = posts[-1], posts[0]
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'), {'page': 2})
+        Post.objects.filter(pk=first_page_post.pk).update(
+            text='Правка без сигнала')
+        second_page_post.text = 'Правка через save'
+        second_page_post.save()
+        first_page = self.client.get(reverse('posts:index'))
+        second_page = self.client.get(reverse('posts:index'), {'page': 2})
+        self.assertNotContains(
+            first_page, 'Правка без сигнала',
+            msg_prefix='первая страница не должна сбрасываться')
+        self.assertContains(
+            second_page, 'Правка через save',
+            msg_prefix='вторая страница не сброшена после правки')
+
+    def test_cache_post_edit_invalidates_tagged_pages(self):
+        """правка поста сбрасывает страницы групп, автора и подписчиков"""
+        follower = User.objects.create_user(username='HarryPotter')
+        Follow.objects.create(user=follower, author=self.user)
+        old_group = Group.objects.create(
+            title='Старая группа', slug='old-group', description='Старая')
+        new_group = Group.objects.create(
+            title='Новая группа', slug='new-group', description='Новая')
+        post = Post.objects.create(
+            author=self.user, group=old_group, text='Тестовый пост')
+        self.client.force_login(follower)
+        pages = (
+            reverse('posts:group_posts', args=(old_group.slug,)),
+            reverse('posts:group_posts', args=(new_group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:follow_index'),
+        )
+        for url in pages:
+            self.client.get(url)
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('posts:post_edit', args=(post.pk,)),
+            {'text': 'Измененный пост', 'group': new_group.pk})
+        self.client.force_login(follower)
+        old_group_page, new_group_page, profile_page, follow_page = (
+            self.client.get(url) for url in pages)
+        self.assertNotContains(
+            old_group_page, 'Тестовый пост',
+            msg_prefix='страница старой группы не сброшена')
+        for response in (new_group_page, profile_page, follow_page):
+            self.assertContains(
+                response, 'Измененный пост',
+                msg_prefix=f'страница {response.request["PATH_INFO"]} '
+                           f'не сброшена после правки')
+
+    def test_fragment_cache_stats(self):
+        """попадания и промахи фрагментов считаются и выводятся командой"""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        url = reverse('posts:profile', args=(self.user.username,))
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(
+            fragment_stats(['profile_page']), {'profile_page': (1, 1)},
+            'неверные счетчики попаданий')
+        out = StringIO()
+        call_command('fragment_cache_stats', 'profile_page', '--reset',
+                     stdout=out)
+        self.assertIn('profile_page | 1 | 1 | 50.0%', out.getvalue())
+        self.assertEqual(
+            fragment_stats(['profile_page']), {'profile_page': (0, 0)},
+            'счетчики не обнулены')
+
+    def test_post_card_cache(self):
+        """карточка поста кешируется по дате изменения и варианту"""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        self.client.get(reverse('posts:index'))
+        self.client.get(
+            reverse('posts:profile', args=(self.user.username,)))
+        self.assertEqual(
+            fragment_stats(['post_card']), {'post_card': (0, 2)},
+            'карточки index и профиля - разные варианты')
+        # новая версия страницы index, но та же карточка
+        Post.objects.create(author=self.user, text='Второй пост')
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            fragment_stats(['post_card']), {'post_card': (1, 3)},
+            'карточка не взята из кеша')
+        post.text = 'Измененный пост'
+        post.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, 'Измененный пост',
+            msg_prefix='карточка не обновилась после правки')
@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Post
+
+User = get_user_model()
+
+
+@override_settings(COMMENTS_ON_PAGE=10)
+class CommentPagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Voldemort')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        # одинаковое время создания: порядок задает pk
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(25))
+        cls.expected = list(Comment.objects.order_by(
+            '-created', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_page_inline(self):
+        """на странице поста только первая страница комментариев"""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.pk for comment in comments], self.expected[:10])
+        self.assertContains(response, 'data-comments-more')
+
+    def test_later_pages_as_fragments(self):
+        """следующие страницы отдаются фрагментами до конца обсуждения"""
+        cursor = self.client.get(reverse(
+            'posts:post_detail', args=(self.post.pk,))).context['next_cursor']
+        seen = []
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        while cursor:
+            # пост, комментарии с авторами; не зависит от глубины
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    url, {'after': cursor},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertTemplateNotUsed(response, 'base.html')
+            seen += [comment.pk for comment in response.context['comments']]
+            cursor = response.context['next_cursor']
+        self.assertEqual(seen, self.expected[10:])
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_comments_page_without_script(self):
+        """без скрипта ссылка открывает целую страницу комментариев"""
+        cursor = self.client.get(reverse(
+            'posts:post_detail', args=(self.post.pk,))).context['next_cursor']
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'after': cursor})
+        self.assertTemplateUsed(response, 'base.html')
+        self.assertIn('X-Requested-With', response['Vary'])
+        self.assertEqual(
+            [comment.pk for comment in response.context['comments']],
+            self.expected[10:20])
+
+
+class FeedCardCommentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Voldemort')
+        cls.reader = User.objects.create_user(username='Harry')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.user, text=f'Пост {i}')
+            for j in range(3):
+                Comment.objects.create(
+                    post=post, author=self.reader, text=f'Ответ {i}-{j}')
+
+    def index_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        return response, len(queries)
+
+    def test_count_and_latest_comment_on_card(self):
+        """карточка показывает число комментариев и последний из них"""
+        self.create_posts(1)
+        response, _ = self.index_queries()
+        self.assertContains(response, 'Комментариев: 3')
+        self.assertContains(response, '<b>Harry</b>: Ответ 0-2')
+
+    def test_queries_do_not_grow_with_posts(self):
+        """число запросов страницы не зависит от числа постов на ней"""
+        self.create_posts(1)
+        _, one_post = self.index_queries()
+        self.create_posts(9)
+        _, ten_posts = self.index_queries()
+        self.assertEqual(one_post, ten_posts)
+
+    def test_new_comment_refreshes_cached_card(self):
+        """новый комментарий меняет закешированную карточку"""
+        self.create_posts(1)
+        self.client.get(reverse('posts:index'))
+        Comment.objects.create(
+            post=Post.objects.get(), author=self.user, text='Свежий ответ')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 4')
+        self.assertContains(response, '<b>Voldemort</b>: Свежий ответ')
@@ -0,0 +1,107 @@
+import gzip
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from ..compression import (CompressionMiddleware, compression_stats,
+                           minify_html, reset_compression_stats)
+
+HTML = ('<html>\n  <body>\n    <p>Текст</p>\n' * 100
+        + '<pre>\n  код\n</pre>\n</body></html>')
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        reset_compression_stats()
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def process(self, response, **headers):
+        request = self.factory.get('/', **headers)
+        request.resolver_match = None
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_minify_keeps_pre(self):
+        """отступы убираются, содержимое pre не меняется"""
+        minified = minify_html(HTML)
+        self.assertIn('<html>\n<body>\n<p>Текст</p>\n', minified)
+        self.assertIn('<pre>\n  код\n</pre>', minified)
+
+    def test_page_compressed_with_stats(self):
+        """страница сжимается gzip, байты попадают в статистику"""
+        response = self.client.get(
+            reverse('posts:index'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        html = gzip.decompress(response.content).decode()
+        self.assertIn('<!DOCTYPE html>', html)
+        responses, original, minified, sent = (
+            compression_stats()['posts:index'])
+        self.assertEqual(responses, 1)
+        self.assertEqual(sent, len(response.content))
+        self.assertLess(minified, original)
+        self.assertLess(sent, minified)
+        out = StringIO()
+        call_command('compression_stats', stdout=out)
+        self.assertIn('posts:index | 1 |', out.getvalue())
+
+    @override_settings(COMPRESS_MIN_SIZE=10 ** 6)
+    def test_small_response_not_compressed(self):
+        """ответ меньше порога не сжимается, но минифицируется"""
+        response = self.process(
+            HttpResponse(HTML), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content.decode(), minify_html(HTML))
+
+    def test_streaming_response_compressed(self):
+        """потоковый ответ сжимается по мере отдачи"""
+        chunks = [HTML.encode()] * 3
+        response = self.process(
+            StreamingHttpResponse(iter(chunks)), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content), b''.join(chunks))
+        self.assertEqual(
+            compression_stats()['unknown'],
+            (1, sum(map(len, chunks)), sum(map(len, chunks)), len(content)))
+
+    def test_strong_etag_weakened(self):
+        """ETag сжатого ответа становится слабым"""
+        response = HttpResponse(HTML)
+        response['ETag'] = '"abc"'
+        response = self.process(response, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+    def test_malformed_accept_encoding(self):
+        """битый q в Accept-Encoding не ломает страницу"""
+        for header in ('gzip;q=.', 'gzip;q=1.2.3', 'br;q=x, gzip;q=0.5'):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    reverse('posts:index'), HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_csrf_page_not_compressed(self):
+        """страница с CSRF-токеном только минифицируется (BREACH)"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        request.resolver_match = None
+        request.META['CSRF_COOKIE_USED'] = True
+        response = CompressionMiddleware(
+            lambda request: HttpResponse(HTML))(request)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content.decode(), minify_html(HTML))
+        self.assertEqual(
+            compression_stats()['unknown'][2:],
+            (len(response.content), len(response.content)))
+
+    @override_settings(COMPRESSION_STATS_FLUSH_INTERVAL=3600)
+    def test_stats_buffered(self):
+        """счетчики копятся в процессе и уходят в кеш пачкой"""
+        self.process(HttpResponse(HTML), HTTP_ACCEPT_ENCODING='gzip')
+        self.process(HttpResponse(HTML), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIsNone(cache.get('compression_stats:views'))
+        self.assertEqual(compression_stats()['unknown'][0], 2)
@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Voldemort')
+        cls.follower = User.objects.create_user(username='HarryPotter')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-group',
+            description='Тестовое описание')
+
+    def setUp(self):
+        cache.clear()
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Тестовый пост')
+        self.client.force_login(self.follower)
+
+    def urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:follow_index'),
+        )
+
+    def assertNotModified(self, url, etag, modified=False):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code, 200 if modified else 304,
+            f'неверный ответ на условный запрос {url}')
+        return response
+
+    def test_not_modified(self):
+        """повторный запрос с тем же ETag получает 304"""
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertNotModified(url, etag)
+                self.assertNotModified(
+                    url + '?page=2', etag, modified=True)
+
+    def test_modified_after_write(self):
+        """комментарий и правка поста меняют ETag страниц с постом"""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls()}
+        Comment.objects.create(
+            post=self.post, author=self.follower, text='Комментарий')
+        self.post.text = 'Измененный пост'
+        self.post.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertNotModified(url, etag, modified=True)
+
+    def test_etag_depends_on_user(self):
+        """ETag другого пользователя не подходит"""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.assertNotModified(url, etag, modified=True)
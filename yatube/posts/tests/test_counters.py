@@ -0,0 +1,92 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, UserStats
+from ..utils import batches
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Voldemort')
+        cls.follower = User.objects.create_user(username='HarryPotter')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count,
+             stats.following_count),
+            (posts, followers, following),
+            'счетчики пользователя не совпадают')
+
+    def test_counters_follow_posts_comments(self):
+        """счетчики меняются при записи и удалении"""
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        comment = Comment.objects.create(
+            post=post, author=self.follower, text='Комментарий')
+        self.assertStats(self.author, 1, 1, 0)
+        self.assertStats(self.follower, 0, 0, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1,
+                         'не учтен новый комментарий')
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0,
+                         'не учтено удаление комментария')
+        follow.delete()
+        post.delete()
+        self.assertStats(self.author, 0, 0, 0)
+        self.assertStats(self.follower, 0, 0, 0)
+
+    def test_counters_on_profile(self):
+        """профиль показывает счетчики без агрегатных запросов"""
+        Post.objects.create(author=self.author, text='Тестовый пост')
+        Follow.objects.create(user=self.follower, author=self.author)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertEqual(response.context['stats'].posts_count, 1)
+        self.assertEqual(response.context['stats'].followers_count, 1)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+
+    def test_reconcile_counters(self):
+        """команда reconcile_counters исправляет расхождения"""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Comment.objects.create(
+            post=post, author=self.follower, text='Комментарий')
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.follower).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.assertIn('пользователи 2, посты 1', out.getvalue())
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.follower, 0, 0, 0)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_keeps_concurrent_increments(self):
+        """комментарий, добавленный после сверки пачки, не теряется"""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+
+        def racing_batches(queryset, batch_size):
+            for batch in batches(queryset, batch_size):
+                Comment.objects.create(
+                    post=post, author=self.follower, text='Комментарий')
+                yield batch
+
+        with mock.patch(
+                'posts.management.commands.reconcile_counters.batches',
+                racing_batches):
+            call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, post.comments.count())
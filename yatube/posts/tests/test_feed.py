@@ -0,0 +1,152 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..feed import get_feed
+from ..models import FeedItem, Follow, Post
+from ..utils import encode_cursor
+
+User = get_user_model()
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Voldemort')
+        cls.follower = User.objects.create_user(username='HarryPotter')
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+
+    def test_feed_push_new_post(self):
+        """новый пост попадает в ленту подписчика"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.follower, post=post).exists(),
+            'пост не попал в ленту подписчика')
+        self.assertFalse(
+            FeedItem.objects.filter(user=self.author).exists(),
+            'пост попал в ленту автора')
+
+    def test_feed_backfill_and_prune(self):
+        """подписка заполняет ленту, отписка очищает её"""
+        Post.objects.create(author=self.author, text='Тестовый пост')
+        self.follower_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        self.assertEqual(
+            FeedItem.objects.filter(user=self.follower).count(), 1,
+            'лента не заполнилась после подписки')
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertFalse(
+            FeedItem.objects.filter(user=self.follower).exists(),
+            'лента не очистилась после отписки')
+
+    @override_settings(FEED_MAX_LENGTH=3)
+    def test_feed_trimmed(self):
+        """длина ленты ограничена FEED_MAX_LENGTH"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        for number in range(5):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        self.assertEqual(
+            FeedItem.objects.filter(user=self.follower).count(), 3,
+            'лента не обрезана до FEED_MAX_LENGTH')
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'][0].text, 'Пост 4',
+            'в ленте нет самого свежего поста')
+
+    @override_settings(FEED_PUSH_FOLLOWERS_LIMIT=2)
+    def test_feed_pull_popular_author(self):
+        """посты популярного автора подмешиваются в ленту при чтении"""
+        reader = User.objects.create_user(username='RonWeasley')
+        star = User.objects.create_user(username='Dumbledore')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=star)
+        Follow.objects.create(user=reader, author=star)
+        Post.objects.create(author=self.author, text='Пост автора 1')
+        star_post = Post.objects.create(author=star, text='Пост звезды')
+        Post.objects.create(author=self.author, text='Пост автора 2')
+        self.assertFalse(
+            FeedItem.objects.filter(post=star_post).exists(),
+            'пост популярного автора записан в ленты')
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост автора 2', 'Пост звезды', 'Пост автора 1'],
+            'ленты слиты в неверном порядке')
+
+    @override_settings(POSTS_ON_PAGE=2, FEED_PUSH_FOLLOWERS_LIMIT=2)
+    def test_feed_cursor_pages(self):
+        """лента листается курсором по строкам ленты без повторов"""
+        reader = User.objects.create_user(username='RonWeasley')
+        star = User.objects.create_user(username='Dumbledore')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=star)
+        Follow.objects.create(user=reader, author=star)
+        posts = [Post.objects.create(author=author, text=f'Пост {number}')
+                 for number in range(3) for author in (self.author, star)]
+        found, params = [], {}
+        while True:
+            response = self.follower_client.get(
+                reverse('posts:follow_index'), params)
+            page = response.context['page_obj']
+            found += page
+            if not page.has_next():
+                break
+            params = {'after': encode_cursor(page[len(page) - 1])}
+        self.assertEqual(found, posts[::-1])
+
+    @override_settings(FEED_PUSH_FOLLOWERS_LIMIT=2)
+    def test_feed_backfill_deferred(self):
+        """дозапись лент после отписки ждет коммита и идет после ответа"""
+        reader = User.objects.create_user(username='RonWeasley')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост звезды')
+        url = reverse('posts:profile_unfollow', args=(self.author.username,))
+        with mock.patch('posts.feed.backfill_followers') as backfill:
+            reader_client.get(url)
+        backfill.assert_not_called()
+        Follow.objects.create(user=reader, author=self.author)
+        with mock.patch('posts.feed.transaction.on_commit',
+                        lambda callback: callback()):
+            reader_client.get(url)
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.follower, post=post).exists(),
+            'посты автора не дописаны в ленту после отписки')
+
+    @override_settings(FEED_PUSH_FOLLOWERS_LIMIT=2)
+    def test_merged_feed_count_ignores_filters(self):
+        """фильтры и курсор по постам не трогают подсчет ленты"""
+        reader = User.objects.create_user(username='RonWeasley')
+        star = User.objects.create_user(username='Dumbledore')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=star)
+        Follow.objects.create(user=reader, author=star)
+        posts = [Post.objects.create(author=author, text='Пост')
+                 for author in (self.author, star)]
+        feed = get_feed(self.follower)
+        self.assertEqual(feed.count(), 2)
+        self.assertEqual(
+            feed.filter(pk__lt=posts[-1].pk, text='Пост').count(), 2)
+        self.assertEqual(
+            list(feed.seek((posts[-1].pub_date, posts[-1].pk))), posts[:1])
+
+    def test_pulled_authors_once_per_request(self):
+        """pull-авторы ищутся один раз на ETag и страницу ленты"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            len([query for query in queries
+                 if 'followers_count" >=' in query['sql']]), 1)
@@ -0,0 +1,98 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.name = default_storage.save(
+            'posts/file.gif', ContentFile(CONTENT))
+        cls.url = reverse('posts:media', args=(cls.name,))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_file_served_with_cache_headers(self):
+        """файл отдается целиком, кеш перепроверяется по ETag"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.MEDIA_REVALIDATE_MAX_AGE}',
+            response['Cache-Control'])
+        self.assertIn('ETag', response)
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(CONTENT_ADDRESSED_UPLOADS=('posts/',))
+    def test_content_addressed_file_immutable(self):
+        """файл с именем по хешу содержимого кешируется навсегда"""
+        name = default_storage.save('posts/other.gif', ContentFile(CONTENT))
+        response = self.client.get(reverse('posts:media', args=(name,)))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.MEDIA_MAX_AGE}', response['Cache-Control'])
+        response.close()
+
+    def test_range(self):
+        """отдается запрошенный диапазон"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            b''.join(response.streaming_content), CONTENT[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[-4:])
+
+    def test_unsatisfiable_range(self):
+        """диапазон за концом файла - 416"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_stale_if_range_returns_whole_file(self):
+        """If-Range с чужим ETag отменяет диапазон"""
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_conditional_request(self):
+        """совпавший ETag - 304 без тела"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(MEDIA_SENDFILE='x-accel')
+    def test_accel_redirect(self):
+        """с прокси отдача передается ему заголовком"""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_PREFIX + self.name)
+        self.assertEqual(response.content, b'')
+
+    def test_outside_media_root(self):
+        """пути вне MEDIA_ROOT и каталоги не отдаются"""
+        for path in ('../settings.py', 'posts/', 'posts/missing.gif'):
+            with self.subTest(path=path):
+                response = self.client.get(settings.MEDIA_URL + path)
+                self.assertEqual(response.status_code, 404)
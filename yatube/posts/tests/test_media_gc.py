@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+
+from .. import thumbnails
+from ..models import Post
+from .test_thumbnails import SMALL_GIF
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.lru.clear()
+        self.used = self.save('posts/used.gif')
+        self.post = Post.objects.create(
+            author=self.user, text='Пост', image=self.used)
+        self.orphan = self.save('posts/orphan.gif')
+        thumbnails.build(self.orphan)
+        self.orphan_thumbnails = [
+            os.path.relpath(os.path.join(root, name), TEMP_MEDIA_ROOT)
+            for root, _, names in os.walk(
+                os.path.join(TEMP_MEDIA_ROOT, 'cache'))
+            for name in names]
+        self.stray = self.save('cache/00/00/stray.jpg')
+        for name in [self.used, self.orphan, self.stray,
+                     *self.orphan_thumbnails]:
+            os.utime(default_storage.path(name), (0, 0))
+        self.fresh = self.save('posts/fresh.gif')
+
+    def save(self, name):
+        return default_storage.save(name, ContentFile(SMALL_GIF))
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media_garbage', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        """пробный запуск только считает файлы"""
+        output = self.collect('--dry-run')
+        self.assertIn('можно удалить: 2', output)
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(self.stray))
+
+    def test_unused_files_deleted(self):
+        """удаляются старые неиспользуемые картинки и их миниатюры"""
+        self.collect('--batch-size', '2')
+        self.assertTrue(default_storage.exists(self.used))
+        self.assertTrue(default_storage.exists(self.fresh))
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertFalse(default_storage.exists(self.stray))
+        self.assertTrue(self.orphan_thumbnails)
+        for name in self.orphan_thumbnails:
+            self.assertFalse(default_storage.exists(name))
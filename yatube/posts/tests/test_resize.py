@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .. import resize
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+RESIZE_ROOT = os.path.join(TEMP_MEDIA_ROOT, 'resize_cache')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_RESIZE_ROOT=RESIZE_ROOT)
+class ResizeTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(RESIZE_ROOT, ignore_errors=True)
+        resize._cache_size = None
+        self.name = self.save('posts/photo.jpg', 'red')
+
+    def get(self, width, height):
+        return self.client.get(resize.resized_url(self.name, width, height))
+
+    def save(self, name, color):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), color).save(buffer, 'JPEG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_resized_image_served_with_cache_headers(self):
+        """картинка обрезается до размера, кеш перепроверяется по ETag"""
+        response = self.get(100, 100)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.MEDIA_REVALIDATE_MAX_AGE}',
+            response['Cache-Control'])
+        content = b''.join(response.streaming_content)
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual(image.size, (100, 100))
+
+    def test_reused_name_resized_again(self):
+        """новый файл под прежним именем не отдается из старого кеша"""
+        response = self.get(100, 100)
+        etag = response['ETag']
+        response.close()
+        default_storage.delete(self.name)
+        self.save(self.name, (0, 0, 250))
+        os.utime(default_storage.path(self.name), (1, 1))
+        response = self.get(100, 100)
+        self.assertNotEqual(response['ETag'], etag)
+        content = b''.join(response.streaming_content)
+        with Image.open(BytesIO(content)) as image:
+            self.assertGreater(image.getpixel((50, 50))[2], 200)
+
+    @override_settings(CONTENT_ADDRESSED_UPLOADS=('posts/',))
+    def test_content_addressed_image_immutable(self):
+        """картинка с именем по хешу содержимого кешируется навсегда"""
+        self.name = self.save('posts/other.jpg', 'green')
+        response = self.get(100, 100)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.IMAGE_RESIZE_MAX_AGE}',
+            response['Cache-Control'])
+        response.close()
+
+    def test_unsigned_size_rejected(self):
+        """размер без верной подписи не отдается"""
+        url = resize.resized_url(self.name, 100, 100).replace(
+            '100x100', '101x100')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_missing_original(self):
+        """нет исходника - 404"""
+        response = self.client.get(
+            resize.resized_url('posts/missing.jpg', 100, 100))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cache_bounded(self):
+        """при переполнении кеша вытесняются давно не запрошенные файлы"""
+        self.get(100, 100).close()
+        version = resize.source_version(self.name)
+        first = resize.resized(self.name, 100, 100, version)
+        os.utime(first, (0, 0))
+        limit = os.path.getsize(first) * 3 // 2
+        with override_settings(IMAGE_RESIZE_CACHE_SIZE=limit):
+            self.get(120, 120).close()
+        self.assertFalse(os.path.exists(first))
+        second = resize.resized(self.name, 120, 120, version)
+        self.assertTrue(os.path.exists(second))
@@ -0,0 +1,147 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+
+    def search(self, query, **params):
+        return self.client.get(reverse('posts:search'), {'q': query, **params})
+
+    def test_search_ranking_and_highlight(self):
+        """поиск ранжирует посты и подсвечивает слова, экранируя текст"""
+        rare = Post.objects.create(
+            author=self.user, text='Про <b>палочку</b> и мантию')
+        often = Post.objects.create(
+            author=self.user, text='Палочка, палочка и еще раз палочка')
+        Post.objects.create(author=self.user, text='Совсем другой пост')
+        response = self.search('ПАЛОЧК')
+        posts = response.context['posts']
+        self.assertEqual(posts, [often, rare], 'неверный порядок выдачи')
+        self.assertContains(response, '<mark>палочку</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_search_index_follows_writes(self):
+        """индекс обновляется при правке, удалении и bulk_create"""
+        post = Post.objects.create(author=self.user, text='Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Массовый текст')])
+        self.assertEqual(self.search('старый').context['posts'], [])
+        self.assertEqual(self.search('новый').context['posts'], [post])
+        self.assertEqual(len(self.search('массовый').context['posts']), 1)
+        post.delete()
+        self.assertEqual(len(self.search('текст').context['posts']), 1)
+
+    @override_settings(POSTS_ON_PAGE=2)
+    def test_search_keyset_pages(self):
+        """выдача листается курсором без пропусков и повторов"""
+        posts = [Post.objects.create(author=self.user, text='Поиск')
+                 for _ in range(5)]
+        found, after = [], None
+        while True:
+            params = {'after': after} if after else {}
+            response = self.search('поиск', **params)
+            found += response.context['posts']
+            after = response.context['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(found, posts[::-1])
+
+    @override_settings(POSTS_ON_PAGE=2)
+    def test_fallback_keyset_pages(self):
+        """без FTS выдача icontains тоже листается курсором"""
+        posts = [Post.objects.create(author=self.user, text='Поиск')
+                 for _ in range(5)]
+        found, after = [], None
+        with mock.patch.object(search, 'available', return_value=False):
+            while True:
+                params = {'after': after} if after else {}
+                response = self.search('Поиск', **params)
+                found += response.context['posts']
+                after = response.context['next_cursor']
+                if after is None:
+                    break
+        self.assertEqual(found, posts[::-1])
+
+    def test_admin_search(self):
+        """поиск в админке идет по полнотекстовому индексу"""
+        post = Post.objects.create(author=self.user, text='Найди меня')
+        Post.objects.create(author=self.user, text='Другой пост')
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'найди'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [post])
+
+    def test_rebuild_search_index(self):
+        """команда восстанавливает индекс после update() в обход сигналов"""
+        post = Post.objects.create(author=self.user, text='Старый текст')
+        Post.objects.create(author=self.user, text='Другой текст')
+        Post.objects.filter(pk=post.pk).update(text='Обновленный текст')
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=1, stdout=out)
+        self.assertIn('Проиндексировано постов: 2', out.getvalue())
+        self.assertEqual(
+            self.search('обновленный').context['posts'], [post])
+        self.assertEqual(self.search('старый').context['posts'], [])
+
+    def test_rebuild_search_index_since(self):
+        """с --since переиндексируются только измененные посты"""
+        Post.objects.create(author=self.user, text='Свежий текст')
+        out = StringIO()
+        call_command(
+            'rebuild_search_index', since='2000-01-01', stdout=out)
+        self.assertIn('Проиндексировано постов: 1', out.getvalue())
+        out = StringIO()
+        call_command(
+            'rebuild_search_index', since='2999-01-01', stdout=out)
+        self.assertIn('Проиндексировано постов: 0', out.getvalue())
+
+    def test_rebuild_search_index_verify(self):
+        """--verify находит правки через update() и bulk_update(),
+        а строки удаленных постов убираются"""
+        post = Post.objects.create(author=self.user, text='Старый текст')
+        other = Post.objects.create(author=self.user, text='Другой текст')
+        gone = Post.objects.create(author=self.user, text='Удаленный текст')
+        Post.objects.filter(pk=post.pk).update(text='Обновленный текст')
+        other.text = 'Массовая правка'
+        Post.objects.bulk_update([other], ['text'])
+        Post.objects.filter(pk=gone.pk)._raw_delete('default')
+        out = StringIO()
+        call_command(
+            'rebuild_search_index', verify=True, batch_size=1, stdout=out)
+        self.assertIn('Проиндексировано постов: 2', out.getvalue())
+        self.assertIn('Удалено строк индекса: 1', out.getvalue())
+        self.assertEqual(
+            self.search('обновленный').context['posts'], [post])
+        self.assertEqual(self.search('массовая').context['posts'], [other])
+        self.assertEqual(self.search('старый').context['posts'], [])
+        self.assertEqual(
+            search.stale_ids(0), [], 'индекс не совпал с постами')
+
+    def test_broken_cursor_ignored(self):
+        """курсор с огромным id или бесконечным rank ведет на начало"""
+        post = Post.objects.create(author=self.user, text='Поиск')
+        for cursor in (search.encode_cursor(0.0, 10 ** 30),
+                       search.encode_cursor(float('inf'), 1)):
+            with self.subTest(cursor=cursor):
+                response = self.search('поиск', after=cursor)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['posts'], [post])
@@ -0,0 +1,89 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+
+from .. import staticfiles
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SOURCE_DIR = os.path.join(TEMP_DIR, 'source')
+STATIC_ROOT = os.path.join(TEMP_DIR, 'static')
+CSS = b'body { color: black; }\n' * 100
+
+
+@override_settings(STATIC_ROOT=STATIC_ROOT, STATICFILES_DIRS=(SOURCE_DIR,))
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(SOURCE_DIR, 'css'))
+        with open(os.path.join(SOURCE_DIR, 'css', 'site.css'), 'wb') as css:
+            css.write(CSS)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(STATIC_ROOT, ignore_errors=True)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        # манифест читается при создании хранилища
+        staticfiles_storage._setup()
+        self.url = static('css/site.css')
+
+    def test_hashed_name_and_compressed_copies(self):
+        """collectstatic пишет имя с хешем и сжатые копии"""
+        name = self.url[len(settings.STATIC_URL):]
+        self.assertRegex(name, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(STATIC_ROOT, name + '.gz'), 'rb') as copy:
+            self.assertEqual(gzip.decompress(copy.read()), CSS)
+        if staticfiles.brotli is not None:
+            self.assertTrue(
+                os.path.exists(os.path.join(STATIC_ROOT, name + '.br')))
+
+    def test_compressed_copy_served(self):
+        """сжатая копия выбирается по Accept-Encoding"""
+        response = self.client.get(
+            self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        content = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content), CSS)
+
+    def test_identity_served(self):
+        """без поддержки сжатия отдается исходный файл"""
+        for header in ('', 'gzip;q=0, identity'):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    self.url, HTTP_ACCEPT_ENCODING=header)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(
+                    b''.join(response.streaming_content), CSS)
+
+    def test_malformed_accept_encoding(self):
+        """испорченный q в Accept-Encoding не ломает отдачу"""
+        for header in ('gzip;q=.', 'gzip;q=1.2.3'):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    self.url, HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                response.close()
+
+    def test_unhashed_name_not_immutable(self):
+        """имя без хеша кешируется ненадолго"""
+        response = self.client.get(
+            settings.STATIC_URL + 'css/site.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.STATIC_MAX_AGE}',
+                      response['Cache-Control'])
+        response.close()
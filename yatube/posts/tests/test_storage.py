@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import Post
+from ..storage import is_content_addressed
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+def upload(content, name='small.gif'):
+    return SimpleUploadedFile(name, content, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content, name='small.gif'):
+        return Post.objects.create(
+            author=self.user, text='Тестовый пост',
+            image=upload(content, name))
+
+    @override_settings(CONTENT_ADDRESSED_UPLOADS=('posts/',))
+    def test_same_content_shares_file(self):
+        """одинаковые картинки хранятся одним файлом в шардах"""
+        first = self.create_post(b'GIF89a-one', 'first.GIF')
+        second = self.create_post(b'GIF89a-one', 'second.gif')
+        other = self.create_post(b'GIF89a-two')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        digest = first.image.name.rsplit('/', 1)[-1]
+        self.assertEqual(
+            first.image.name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}')
+        self.assertTrue(digest.endswith('.gif'))
+
+    def test_flat_names_by_default(self):
+        """без настройки файлы сохраняются как раньше"""
+        post = self.create_post(b'GIF89a-flat', 'flat.gif')
+        self.assertEqual(post.image.name, 'posts/flat.gif')
+
+    def test_rehash_post_images(self):
+        """команда переписывает пути и удаляет дубликаты"""
+        first = self.create_post(b'GIF89a-same', 'a.gif')
+        second = self.create_post(b'GIF89a-same', 'b.gif')
+        Post.objects.create(
+            author=self.user, text='Без файла', image='posts/missing.gif')
+        old_names = [first.image.name, second.image.name]
+        with override_settings(CONTENT_ADDRESSED_UPLOADS=('posts/',)):
+            out = StringIO()
+            call_command('rehash_post_images', batch_size=1,
+                         delete_old=True, stdout=out)
+            first.refresh_from_db()
+            second.refresh_from_db()
+            self.assertTrue(is_content_addressed(first.image.name))
+        self.assertIn('Перенесено картинок: 2, нет файла: 1',
+                      out.getvalue())
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.read(), b'GIF89a-same')
+        for name in old_names:
+            self.assertFalse(default_storage.exists(name))
@@ -0,0 +1,264 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from .. import thumbnails
+from ..kvstore import KVStore, LRUCache
+from ..models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B')
+
+
+def run_on_commit(callback):
+    # TestCase не фиксирует транзакции, on_commit вызываем сразу
+    callback()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.lru.clear()
+        self.client.force_login(self.user)
+
+    def create_post(self, text='Тестовый пост'):
+        return Post.objects.create(
+            author=self.user, text=text,
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'))
+
+    @mock.patch('posts.thumbnails.transaction.on_commit', run_on_commit)
+    def test_thumbnail_generated_after_response(self):
+        """миниатюра строится после ответа на создание поста"""
+        with mock.patch.object(
+                thumbnails, 'generate', wraps=thumbnails.generate) as gen:
+            self.client.post(reverse('posts:post_create'), {
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    'small.gif', SMALL_GIF, content_type='image/gif'),
+            })
+        post = Post.objects.get()
+        gen.assert_called_once_with(post.pk, post.image.name)
+        self.assertIsNotNone(
+            thumbnails.cached_picture(post.image, 'card'),
+            'миниатюры не построены')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img')
+        self.assertNotContains(response, thumbnails.PENDING_MARKER)
+
+    @override_settings(POST_IMAGES={'card': {
+        'size': (200, 100), 'widths': (100, 200), 'formats': ('JPEG',),
+        'sizes': '100vw', 'options': {'crop': 'center', 'upscale': True}}})
+    def test_responsive_variants(self):
+        """все ширины варианта выводятся в srcset"""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'))
+        thumbnails.generate(post.pk, post.image.name)
+        picture = thumbnails.cached_picture(post.image, 'card')
+        self.assertEqual(
+            {tuple(thumbnail.size)
+             for thumbnail in picture.thumbnails.values()},
+            {(100, 50), (200, 100)}, 'неверные размеры миниатюр')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, f'srcset="{picture.fallback_srcset}" sizes="100vw"')
+        self.assertContains(response, f'src="{picture.src}"')
+        self.assertIn(' 100w, ', picture.fallback_srcset)
+
+    @override_settings(POST_IMAGES={'detail': {
+        'size': (200, None), 'widths': (100, 200), 'formats': ('JPEG',),
+        'sizes': '100vw', 'options': {'upscale': True}}})
+    def test_detail_keeps_aspect_ratio(self):
+        """на странице поста картинка не обрезается, а width и height
+        берутся из сохраненных размеров"""
+        post = self.create_post()
+        url = reverse('posts:post_detail', args=(post.pk,))
+        self.assertContains(self.client.get(url), 'aspect-ratio: 200 / 100')
+        thumbnails.generate(post.pk, post.image.name)
+        picture = thumbnails.cached_picture(post.image, 'detail')
+        self.assertEqual(
+            {tuple(thumbnail.size)
+             for thumbnail in picture.thumbnails.values()},
+            {(100, 50), (200, 100)}, 'пропорции картинки не сохранены')
+        self.assertContains(
+            self.client.get(url), 'width="200" height="100"')
+
+    def test_placeholder_until_thumbnail_exists(self):
+        """пока миниатюры нет, выводится заглушка и страница не кешируется"""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnails.PENDING_MARKER)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        thumbnails.generate(post.pk, post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, thumbnails.PENDING_MARKER)
+        self.assertContains(response, '<img class="card-img')
+
+    def test_image_metadata_stored_on_upload(self):
+        """размеры и заглушка картинки сохраняются при загрузке"""
+        post = self.create_post()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        thumbnails.generate(post.pk, post.image.name)
+        with mock.patch('posts.images.Image.open') as image_open:
+            response = self.client.get(reverse('posts:index'))
+        image_open.assert_not_called()
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_image_metadata_cleared_with_image(self):
+        """без картинки размеры и заглушка очищаются"""
+        post = self.create_post()
+        post.image = ''
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_broken_image_is_not_retried(self):
+        """испорченная картинка не обрабатывается на каждом просмотре"""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', image='posts/missing.jpg')
+        thumbnails.generate(post.pk, post.image.name)
+        with mock.patch.object(thumbnails.transaction, 'on_commit') as later:
+            thumbnails.schedule(post.image)
+        later.assert_not_called()
+
+    def test_page_thumbnails_fetched_in_batch(self):
+        """миниатюры страницы читаются из kvstore одним пакетом"""
+        for number in range(3):
+            post = self.create_post(f'Пост {number}')
+            thumbnails.generate(post.pk, post.image.name)
+        cache.clear()
+        default.kvstore.lru.clear()
+        single_lookup = mock.patch.object(
+            default.kvstore, '_get_raw',
+            side_effect=AssertionError('поштучный запрос к kvstore'))
+        with single_lookup:
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img', count=3)
+        cache.clear()
+        # второй раз метаданные берутся из LRU процесса
+        with single_lookup, mock.patch(
+                'posts.kvstore.KVStoreModel.objects.filter',
+                side_effect=AssertionError('запрос к базе мимо LRU')):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img', count=3)
+
+    @override_settings(THUMBNAIL_LRU_CHECK_INTERVAL=0)
+    def test_lru_dropped_after_delete_elsewhere(self):
+        """удаление миниатюры в другом процессе сбрасывает LRU"""
+        post = self.create_post()
+        thumbnails.generate(post.pk, post.image.name)
+        other = KVStore()
+        self.assertIsNotNone(thumbnails.cached_picture(post.image, 'card'))
+        for thumbnail in thumbnails.cached_picture(
+                post.image, 'card').thumbnails.values():
+            other.delete(thumbnail)
+        self.assertIsNone(thumbnails.cached_picture(post.image, 'card'))
+
+    def test_lru_is_bounded(self):
+        """LRU вытесняет давно не читавшиеся записи"""
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(
+            (lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RegenerateThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.lru.clear()
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint.json')
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}',
+                image=SimpleUploadedFile(
+                    f'small{i}.gif', SMALL_GIF, content_type='image/gif'))
+            for i in range(3)]
+
+    def regenerate(self, *args):
+        out = StringIO()
+        call_command(
+            'regenerate_thumbnails', '--workers', '1', '--batch-size', '2',
+            '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_all_images_regenerated(self):
+        """команда строит миниатюры всех картинок и удаляет позицию"""
+        output = self.regenerate()
+        for post in self.posts:
+            self.assertIsNotNone(
+                thumbnails.cached_picture(post.image, 'card'))
+        self.assertIn('Готово картинок: 3, ошибок: 0', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        """прерванный запуск продолжается после сохраненного поста"""
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'last_id': self.posts[0].pk, 'built': 1,
+                       'failed': 0}, checkpoint)
+        output = self.regenerate()
+        self.assertIsNone(
+            thumbnails.cached_picture(self.posts[0].image, 'card'))
+        self.assertIsNotNone(
+            thumbnails.cached_picture(self.posts[2].image, 'card'))
+        self.assertIn('Постов: 2 из 2', output)
+
+    def test_unknown_alias(self):
+        """неизвестный вариант - ошибка команды"""
+        with self.assertRaises(CommandError):
+            self.regenerate('--alias', 'missing')
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..forms import PostForm
+from ..models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+# тег EXIF с моделью камеры
+EXIF_MODEL = 0x0110
+
+
+def jpeg(size, exif=None):
+    buffer = BytesIO()
+    options = {}
+    if exif:
+        options['exif'] = exif.tobytes()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', **options)
+    return SimpleUploadedFile(
+        'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Voldemort')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой', 'image': image})
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_upload_over_byte_limit_rejected(self):
+        """файл больше лимита байт не принимается"""
+        response = self.create(SimpleUploadedFile(
+            'big.jpg', b'\xff' * 4096, content_type='image/jpeg'))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 0 МБ')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100 * 100)
+    def test_upload_over_pixel_limit_rejected(self):
+        """картинка больше лимита пикселей не принимается"""
+        response = self.create(jpeg((200, 100)))
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 0 мегапикселей')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=64)
+    def test_truncated_oversized_image_rejected(self):
+        """обрезанная большая картинка отклоняется формой, а не 500"""
+        buffer = BytesIO()
+        Image.effect_noise((300, 200), 64).convert('RGB').save(
+            buffer, 'JPEG')
+        data = buffer.getvalue()
+        response = self.create(SimpleUploadedFile(
+            'photo.jpg', data[:len(data) // 2], content_type='image/jpeg'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response, 'form', 'image',
+            PostForm.base_fields['image'].error_messages['invalid_image'])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=64)
+    def test_oversized_image_downscaled(self):
+        """большая картинка уменьшается до максимальной стороны"""
+        self.create(jpeg((256, 128)))
+        post = Post.objects.get()
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (64, 32))
+        self.assertEqual((post.image_width, post.image_height), (64, 32))
+
+    def test_metadata_stripped(self):
+        """EXIF удаляется из сохраненной картинки"""
+        exif = Image.Exif()
+        exif[EXIF_MODEL] = 'Camera'
+        self.create(jpeg((32, 32), exif))
+        post = Post.objects.get()
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (32, 32))
+            self.assertNotIn('exif', image.info)
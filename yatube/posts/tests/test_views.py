@@ -1,3 +1,4 @@
+import base64
 import shutil
 import tempfile
 
@@ -5,18 +6,26 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
 from ..forms import PostForm
 from ..models import Group, Post, Follow
+from ..templatetags.posts_pagination import end_cursor
+from ..utils import encode_cursor
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
 BULK_POSTS_COUNT = 13
 
 
+def encode_raw(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewsTests(TestCase):
     @classmethod
@@ -182,6 +191,94 @@ class PostViewsTests(TestCase):
                             len(response.context['page_obj']), post_count,
                             'пагинатор отображает неверное количество постов')
 
+    @override_settings(POSTS_ON_PAGE=1, PAGINATOR_WINDOW=3)
+    def test_post_views_paginator_window(self):
+        """Паджинатор показывает только окно ссылок без COUNT(*)."""
+        Post.objects.bulk_create([
+            Post(text=f'Тестовый пост #{post_object_id}',
+                 author=self.author,
+                 ) for post_object_id in range(BULK_POSTS_COUNT - 1)])
+        response = self.follower_client.get(
+            reverse('posts:index'), {'page': 7})
+        content = response.content.decode()
+        for page in (4, 5, 6, 8, 9, 10):
+            with self.subTest(page=page):
+                self.assertIn(f'?page={page}"', content,
+                              'нет ссылки на страницу из окна')
+        for page in (2, 3, 11, 12):
+            with self.subTest(page=page):
+                self.assertNotIn(f'?page={page}"', content,
+                                 'ссылка на страницу вне окна')
+        self.assertNotIn('?page=13"', content,
+                         'ссылка на последнюю страницу по номеру')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'), {'page': 8})
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']],
+            'страница по номеру считает посты')
+
+    @override_settings(POSTS_ON_PAGE=2, PAGINATOR_MAX_PAGE=3)
+    def test_post_views_paginator_bounded(self):
+        """Глубокий ?page= не доходит до большого OFFSET, а последняя
+        страница открывается курсором от конца ленты."""
+        Post.objects.bulk_create([
+            Post(text=f'Тестовый пост #{post_object_id}',
+                 author=self.author,
+                 ) for post_object_id in range(BULK_POSTS_COUNT - 1)])
+        posts = list(Post.objects.order_by('-pub_date', '-pk'))
+        response = self.client.get(reverse('posts:index'), {'page': 1000})
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(list(response.context['page_obj']), posts[4:6])
+        self.assertContains(response, f'?before={end_cursor()}')
+        last_page = self.client.get(
+            reverse('posts:index'), {'before': end_cursor()}).context[
+            'page_obj']
+        self.assertEqual(list(last_page), posts[-2:])
+        self.assertFalse(last_page.has_next())
+        self.assertTrue(last_page.has_previous())
+
+    def test_post_views_cursor_paginator(self):
+        """Переход по курсорам ?after=/?before= во всех лентах."""
+        Post.objects.all().delete()
+        Post.objects.bulk_create([
+            Post(text=f'Тестовый пост #{post_object_id}',
+                 author=self.author,
+                 group=self.group,
+                 ) for post_object_id in range(BULK_POSTS_COUNT)])
+        pages_names = (
+            ('posts:index', None),
+            ('posts:group_posts', (self.group.slug,)),
+            ('posts:profile', (self.author.username,)),
+            ('posts:follow_index', None)
+        )
+        for page_name, args in pages_names:
+            with self.subTest(page_name=page_name):
+                url = reverse(page_name, args=args)
+                first_page = self.follower_client.get(url).context[
+                    'page_obj']
+                next_page = self.follower_client.get(
+                    url, {'after': encode_cursor(first_page[-1])}).context[
+                    'page_obj']
+                self.assertEqual(
+                    len(next_page), BULK_POSTS_COUNT - settings.POSTS_ON_PAGE,
+                    'курсор ?after= отдает неверное количество постов')
+                self.assertFalse(next_page.has_next())
+                self.assertNotIn(next_page[0], list(first_page))
+                previous_page = self.follower_client.get(
+                    url, {'before': encode_cursor(next_page[0])}).context[
+                    'page_obj']
+                self.assertEqual(
+                    list(previous_page), list(first_page),
+                    'курсор ?before= не возвращает на предыдущую страницу')
+                for broken in ('broken', encode_raw(
+                        '2020-01-01T00:00:00+00:00|' + '9' * 30),
+                        encode_raw('2020-01-01T00:00:00|1')):
+                    broken_page = self.follower_client.get(
+                        url, {'after': broken}).context['page_obj']
+                    self.assertEqual(
+                        broken_page.number, 1,
+                        'испорченный курсор не ведет на 1 страницу')
+
     def test_post_follow_index(self):
         """тестируем работу follow_index. Страница доступна только
         поьлзователям кто подписан на автора(ов)"""
@@ -0,0 +1,230 @@
+"""Миниатюры картинок постов, подготовленные заранее.
+
+Шаблоны только ищут готовую миниатюру в kvstore sorl-thumbnail и не
+обрабатывают картинку сами: пока миниатюры нет, выводится заглушка.
+Миниатюры всех вариантов из settings.POST_IMAGES строятся после
+коммита, а внутри запроса - уже после отправки ответа клиенту
+(request_finished), так что обработка картинки не входит во время
+ответа ни автору поста, ни читателям.
+"""
+import logging
+import threading
+
+from PIL import features
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from sorl.thumbnail import base, default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+# атрибут заглушки: фрагменты с ним не кешируются
+PENDING_MARKER = 'data-thumbnail-pending'
+FAILED_TIMEOUT = 60 * 60
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+_local = threading.local()
+
+
+class ThumbnailBackend(base.ThumbnailBackend):
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile будущей миниатюры без обращения к хранилищам.
+
+        Опции дополняются так же, как в get_thumbnail, чтобы имя
+        миниатюры совпало.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из kvstore или None, без обработки картинки."""
+        return default.kvstore.get(
+            self.get_thumbnail_file(file_, geometry_string, **options))
+
+
+def formats(alias):
+    """Форматы варианта, которые умеет кодировать установленный Pillow."""
+    return [image_format for image_format in settings.POST_IMAGES[alias][
+        'formats'] if image_format != 'WEBP' or features.check('webp')]
+
+
+def geometry(alias, width):
+    """Строка геометрии sorl для ширины с пропорциями варианта.
+
+    У варианта без высоты пропорции берутся из самой картинки.
+    """
+    base_width, base_height = settings.POST_IMAGES[alias]['size']
+    if base_height is None:
+        return str(width)
+    return f'{width}x{round(width * base_height / base_width)}'
+
+
+def dimensions(alias, post):
+    """Ширина и высота варианта для атрибутов width и height.
+
+    Варианту без высоты нужны размеры картинки, сохраненные в посте;
+    пока их нет (старые посты до fill_image_metadata), высота None.
+    """
+    width, height = settings.POST_IMAGES[alias]['size']
+    if height is None and post.image_width and post.image_height:
+        height = round(width * post.image_height / post.image_width)
+    return width, height
+
+
+def variants(alias):
+    """(формат, ширина, геометрия, опции) всех миниатюр варианта."""
+    config = settings.POST_IMAGES[alias]
+    for image_format in formats(alias):
+        for width in config['widths']:
+            options = dict(config.get('options', {}), format=image_format)
+            yield image_format, width, geometry(alias, width), options
+
+
+class Picture:
+    """Миниатюры картинки одного варианта для <picture> со srcset.
+
+    Последний формат варианта - запасной: он идет в <img>, остальные -
+    в <source>.
+    """
+
+    def __init__(self, alias, thumbnails, post):
+        self.config = settings.POST_IMAGES[alias]
+        self.thumbnails = thumbnails
+        self.formats = formats(alias)
+        self.sizes = self.config['sizes']
+        self.width, self.height = dimensions(alias, post)
+
+    def srcset(self, image_format):
+        return ', '.join(
+            f'{self.thumbnails[image_format, width].url} {width}w'
+            for width in self.config['widths'])
+
+    @property
+    def sources(self):
+        return [{'type': MIME_TYPES[image_format],
+                 'srcset': self.srcset(image_format)}
+                for image_format in self.formats[:-1]]
+
+    @property
+    def fallback_srcset(self):
+        return self.srcset(self.formats[-1])
+
+    @property
+    def src(self):
+        return self.thumbnails[self.formats[-1], self.width].url
+
+
+def cached_picture(image, alias):
+    """Picture из готовых миниатюр или None, если хоть одной нет."""
+    prefetched = getattr(image.instance, '_prefetched_pictures', {})
+    if alias in prefetched:
+        return prefetched[alias]
+    thumbnails = {}
+    for image_format, width, geometry_string, options in variants(alias):
+        thumbnail = default.backend.get_cached_thumbnail(
+            image, geometry_string, **options)
+        if thumbnail is None:
+            return None
+        thumbnails[image_format, width] = thumbnail
+    return Picture(alias, thumbnails, image.instance)
+
+
+def prefetch_pictures(posts, alias):
+    """Ищет миниатюры картинок всех постов одним запросом к kvstore.
+
+    Результат запоминается в постах, и cached_picture их уже не ищет.
+    """
+    wanted = {}
+    for post in posts:
+        if post.image:
+            wanted[post] = {
+                (image_format, width): default.backend.get_thumbnail_file(
+                    post.image, geometry_string, **options)
+                for image_format, width, geometry_string, options
+                in variants(alias)}
+    found = default.kvstore.get_many([
+        thumbnail for files in wanted.values()
+        for thumbnail in files.values()])
+    for post, files in wanted.items():
+        thumbnails = {variant: found[thumbnail.key]
+                      for variant, thumbnail in files.items()}
+        picture = None
+        if None not in thumbnails.values():
+            picture = Picture(alias, thumbnails, post)
+        if not hasattr(post, '_prefetched_pictures'):
+            post._prefetched_pictures = {}
+        post._prefetched_pictures[alias] = picture
+
+
+def _failed_key(image_name):
+    return f'thumbnail_failed:{image_name}'
+
+
+def build(image_name, aliases=None):
+    """Строит миниатюры вариантов картинки; False, если не получилось."""
+    for alias in aliases or settings.POST_IMAGES:
+        for _, _, geometry_string, options in variants(alias):
+            try:
+                thumbnail = default.backend.get_thumbnail(
+                    image_name, geometry_string, **options)
+            except Exception:
+                logger.exception(
+                    'Не удалось построить миниатюру %s', image_name)
+                return False
+            if thumbnail is None or not default.kvstore.get(thumbnail):
+                return False
+    return True
+
+
+def generate(post_id, image_name):
+    """Строит все миниатюры картинки и сбрасывает кеш страниц поста."""
+    from . import caching
+    from .models import Post
+
+    if not build(image_name):
+        # исходный файл испорчен или пропал: не повторяем на каждом
+        # просмотре страницы
+        cache.set(_failed_key(image_name), True, FAILED_TIMEOUT)
+        return
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        caching.bump_post(post)
+
+
+def _defer(post_id, image_name):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        # вне запроса: команда управления, shell
+        generate(post_id, image_name)
+    else:
+        pending[image_name] = post_id
+
+
+def schedule(image):
+    """Ставит построение миниатюр картинки поста после коммита."""
+    if not image or cache.get(_failed_key(image.name)):
+        return
+    post_id, image_name = image.instance.pk, image.name
+    transaction.on_commit(lambda: _defer(post_id, image_name))
+
+
+def start_request():
+    _local.pending = {}
+
+
+def finish_request():
+    pending = getattr(_local, 'pending', None) or {}
+    _local.pending = None
+    for image_name, post_id in pending.items():
+        generate(post_id, image_name)
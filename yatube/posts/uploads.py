@@ -0,0 +1,117 @@
+"""Прием картинок постов с ограниченным расходом памяти.
+
+Загрузка идет на диск кусками (FILE_UPLOAD_MAX_MEMORY_SIZE), а
+LimitedUploadHandler перестает принимать файл, как только он превысил
+settings.POST_IMAGE_MAX_BYTES. Число пикселей проверяется по заголовку
+до декодирования. Слишком большие картинки уменьшаются, метаданные
+удаляются, так что хранилище и миниатюры работают с ограниченными
+исходниками.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageOps
+
+# форматы, которые перекодируются в себя же; остальные - в PNG
+KEEP_FORMATS = ('JPEG', 'PNG', 'WEBP')
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+}
+METADATA_KEYS = ('exif', 'comment', 'xmp', 'XML:com.adobe.xmp',
+                 'photoshop')
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class OversizedUpload(UploadedFile):
+    """Отвергнутая загрузка: только имя и размер, без содержимого."""
+
+    def __init__(self, name, content_type, size):
+        super().__init__(None, name, content_type, size)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Отбрасывает файлы больше settings.POST_IMAGE_MAX_BYTES.
+
+    Стоит первым в FILE_UPLOAD_HANDLERS: после превышения лимита куски
+    не доходят до следующих обработчиков и не пишутся на диск, а вместо
+    файла в request.FILES попадает OversizedUpload, которую отклоняет
+    форма.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            # недописанные файлы следующих обработчиков больше не нужны
+            for handler in self.request.upload_handlers:
+                if handler is not self and hasattr(handler, 'file'):
+                    handler.file.close()
+            return OversizedUpload(
+                self.file_name, self.content_type, self.received)
+        return None
+
+
+def has_metadata(image):
+    return (any(key in image.info for key in METADATA_KEYS)
+            or bool(getattr(image, 'text', None)))
+
+
+def normalize_upload(upload):
+    """Загруженная картинка в пределах лимитов и без метаданных.
+
+    Возвращает тот же файл, если менять нечего, иначе новый, который
+    уходит на диск после FILE_UPLOAD_MAX_MEMORY_SIZE. Анимации не
+    перекодируются.
+    """
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(upload.name)
+        oversized = max(width, height) > max_side
+        if (getattr(image, 'n_frames', 1) > 1
+                or not (oversized or has_metadata(image))):
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        if image_format not in KEEP_FORMATS:
+            image_format = 'PNG'
+            converted = True
+        else:
+            converted = False
+        icc_profile = image.info.get('icc_profile')
+        # JPEG сразу декодируется в уменьшенном масштабе
+        image.draft(image.mode, (max_side, max_side))
+        # поворот из EXIF применяется к пикселям до удаления EXIF
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    name, extension = os.path.splitext(upload.name)
+    if converted:
+        extension = '.png'
+    output = tempfile.SpooledTemporaryFile(
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    options = dict(SAVE_OPTIONS[image_format])
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(output, image_format, **options)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, name + extension, Image.MIME[image_format], size)
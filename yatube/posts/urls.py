@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path
 
 from . import views
@@ -11,11 +10,20 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('search/', views.search, name='search'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('img/<int:width>x<int:height>/<path:path>', views.resized_image,
+         name='resized_image'),
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', views.media_file,
+         name='media'),
+    path(f'{settings.STATIC_URL.lstrip("/")}<path:path>', views.static_file,
+         name='static'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -27,7 +35,3 @@ urlpatterns = [
         name='profile_unfollow'
     ),
 ]
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
@@ -1,8 +1,272 @@
+import base64
+import binascii
+from datetime import datetime
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# порядок постов, на котором работает постраничная навигация по курсору
+CURSOR_ORDERING = ('-pub_date', '-pk')
+# позиция за самым старым постом: ?before= с ней открывает последнюю
+# страницу обратным проходом по индексу, без OFFSET и COUNT
+END_POSITION = (datetime(1970, 1, 1, tzinfo=timezone.utc), 0)
+# наибольший id, который принимает INTEGER в базе
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(value):
+    """id из пользовательского ввода или None, если он вне 0..MAX_ID."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if 0 <= value <= MAX_ID else None
+
+
+def count_key(scope, pk=None):
+    """Ключ кеша с количеством постов ленты: index, group, feed."""
+    if pk is None:
+        return f'posts_count:{scope}'
+    return f'posts_count:{scope}:{pk}'
+
+
+def invalidate_counts(*keys):
+    cache.delete_many(keys)
+
+
+def invalidate_post_counts(post, old_group_id=None):
+    """Сбрасывает количества в лентах, куда входит пост."""
+    keys = [count_key('index')]
+    for group_id in {post.group_id, old_group_id} - {None}:
+        keys.append(count_key('group', group_id))
+    invalidate_counts(*keys)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, которому для страницы не нужен COUNT(*).
+
+    Номер страницы ограничен settings.PAGINATOR_MAX_PAGE, так что OFFSET
+    не растет с подменой ?page= в адресе, а дальше листают курсором.
+    Наличие следующих страниц определяется лишними строками выборки.
+    Количество объектов для тех, кому оно нужно, хранится в кеше
+    settings.PAGINATOR_COUNT_TIMEOUT секунд и сбрасывается сигналами.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, count=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(
+                self.count_key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не целое число')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return min(number, settings.PAGINATOR_MAX_PAGE)
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except (PageNotAnInteger, EmptyPage):
+            number = 1
+        page = self.page(number)
+        if not page.object_list and number > 1:
+            # номер за концом ленты: последняя страница обратным проходом
+            return cursor_page(
+                self, self.object_list, encode_position(*END_POSITION),
+                forward=False)
+        return page
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        page = self._get_page(objects[:self.per_page], number, self)
+        # страница остается обычной Page, но о продолжении и своих
+        # индексах знает без num_pages
+        has_next = len(objects) > self.per_page
+        start = bottom + 1 if page.object_list else bottom
+        page.has_next = lambda: has_next
+        page.start_index = lambda: start
+        page.end_index = lambda: bottom + len(page.object_list)
+        return page
+
+    def page_window(self, number):
+        """Номера страниц вокруг текущей для ссылок навигации.
+
+        Сколько страниц есть впереди, узнается по id строк окна, а не
+        по общему количеству.
+        """
+        window = settings.PAGINATOR_WINDOW
+        last = min(number + window, settings.PAGINATOR_MAX_PAGE)
+        object_list = self.object_list
+        if hasattr(object_list, 'values_list'):
+            object_list = object_list.values_list('pk', flat=True)
+        ahead = len(object_list[number * self.per_page:last * self.per_page])
+        last = number + -(-ahead // self.per_page)
+        return range(max(1, number - window), last + 1)
+
+
+def batches(queryset, batch_size):
+    """Пачки объектов по возрастанию pk без OFFSET."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
 
+def encode_position(moment, pk):
+    """Непрозрачный токен позиции в списке по (дата, pk)."""
+    raw = f'{moment.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
 
-def posts_paginator(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_ON_PAGE)
+
+def encode_cursor(post):
+    """Токен позиции поста в ленте: (pub_date, pk)."""
+    return encode_position(post.pub_date, post.pk)
+
+
+def decode_cursor(token):
+    """Возвращает (дата, pk) или None для испорченного токена."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date, pk = parse_datetime(pub_date), parse_id(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    # наивная дата сравнивалась бы со сдвигом на часовой пояс
+    if pub_date is None or pk is None or timezone.is_naive(pub_date):
+        return None
+    return pub_date, pk
+
+
+def seek(post_list, cursor, forward=True):
+    """Посты строго после (forward) или до курсора в порядке обхода.
+
+    Условие по (pub_date, pk) использует индекс, поэтому стоимость
+    страницы не зависит от её глубины. Списки со своим порядком обхода,
+    например лента подписок, навигируют сами через метод seek().
+    """
+    if hasattr(post_list, 'seek'):
+        return post_list.seek(cursor, forward)
+    pub_date, pk = cursor
+    if forward:
+        return post_list.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+        ).order_by(*CURSOR_ORDERING)
+    return post_list.filter(
+        Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+    ).order_by('pub_date', 'pk')
+
+
+class CursorPage(Page):
+    """Страница, найденная по курсору, а не по номеру.
+
+    Номер страницы неизвестен, поэтому number равен None, а наличие
+    соседних страниц определяется лишней строкой выборки.
+    """
+
+    def __init__(self, object_list, paginator, cursor, has_next,
+                 has_previous):
+        super().__init__(object_list, None, paginator)
+        self.cursor = cursor
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Page {self.cursor}>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+def cursor_page(paginator, post_list, cursor, forward=True):
+    per_page = paginator.per_page
+    posts = list(seek(post_list, decode_cursor(cursor), forward)[
+        :per_page + 1])
+    has_more = len(posts) > per_page
+    posts = posts[:per_page]
+    if forward:
+        return CursorPage(
+            posts, paginator, f'after:{cursor}', has_more, True)
+    if not has_more:
+        # вернулись к началу ленты
+        return paginator.page(1)
+    posts.reverse()
+    return CursorPage(
+        posts, paginator, f'before:{cursor}',
+        decode_cursor(cursor) != END_POSITION, True)
+
+
+def posts_paginator(request, post_list, count_key=None, count=None):
+    """Страница постов по ?after=/?before= курсору или по ?page=N.
+
+    count_key - ключ кеша для количества постов, см. count_key();
+    count - уже известное количество, например из счетчиков автора.
+    """
+    paginator = CachedCountPaginator(
+        post_list, settings.POSTS_ON_PAGE, count_key, count)
+    for direction, forward in (('after', True), ('before', False)):
+        cursor = request.GET.get(direction)
+        if decode_cursor(cursor) is not None:
+            return cursor_page(paginator, post_list, cursor, forward)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+def comments_page(post, cursor=None):
+    """Страница комментариев поста, новые сверху, и курсор следующей.
+
+    Страница выбирается по (created, pk) после курсора, поэтому память
+    и время не зависят от длины обсуждения.
+    """
+    comments = post.comments.select_related('author').order_by(
+        '-created', '-pk')
+    position = decode_cursor(cursor)
+    if position is not None:
+        created, pk = position
+        comments = comments.filter(
+            Q(created__lt=created) | Q(created=created, pk__lt=pk))
+    limit = settings.COMMENTS_ON_PAGE
+    comments = list(comments[:limit + 1])
+    if len(comments) <= limit:
+        return comments, None
+    comments = comments[:limit]
+    last = comments[-1]
+    return comments, encode_position(last.created, last.pk)
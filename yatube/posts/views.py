@@ -1,62 +1,130 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.http import Http404
 from django.shortcuts import get_object_or_404, render, redirect
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlquote
 # from django.views.decorators.cache import cache_page
-
+from django.views.decorators.http import etag
+
+from .caching import (follow_page_generation, group_page_generation,
+                      index_page_generation, profile_page_generation)
+from . import media, resize, staticfiles
+from .counters import get_stats
+from .etags import (follow_index_etag, group_posts_etag, index_etag,
+                    post_comments_etag, post_detail_etag, profile_etag)
+from .feed import get_feed, request_pulled_authors
 from .forms import PostForm, CommentForm
 from .models import Group, Post, User, Follow
-from .utils import posts_paginator
+from .search import search as search_posts
+from .storage import is_content_addressed
+from .utils import comments_page, count_key, posts_paginator
 
 User = get_user_model()
 
 
 # @cache_page(20, key_prefix='index_page') кешируем в шаблоне
+@etag(index_etag)
 def index(request):
-    post_list = Post.objects.select_related('author', 'group')
+    post_list = Post.objects.select_related(
+        'author', 'group').with_latest_comment()
+    page_obj = posts_paginator(request, post_list, count_key('index'))
     context = {
-        'page_obj': posts_paginator(request, post_list),
+        'page_obj': page_obj,
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'cache_version': index_page_generation(page_obj),
     }
     return render(request, 'posts/index.html', context)
 
 
+@etag(group_posts_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.select_related('author').filter(group=group)
+    post_list = group.posts.select_related('author').filter(
+        group=group).with_latest_comment()
 
     context = {
         'group': group,
-        'page_obj': posts_paginator(request, post_list),
+        'page_obj': posts_paginator(
+            request, post_list, count_key('group', group.pk)),
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'cache_version': group_page_generation(group),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@etag(profile_etag)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related('group').filter(author=author)
+    post_list = author.posts.select_related('group').filter(
+        author=author).with_latest_comment()
+    stats = get_stats(author)
     if request.user.is_authenticated:
         following = author.following.filter(user=request.user).exists()
     else:
         following = False
     context = {
         'author': author,
-        'page_obj': posts_paginator(request, post_list),
+        'page_obj': posts_paginator(
+            request, post_list, count=stats.posts_count),
         'following': following,
+        'stats': stats,
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'cache_version': profile_page_generation(author),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@etag(post_detail_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post.objects.prefetch_related(
-        'comments__author'), pk=post_id)
+    post = get_object_or_404(Post.objects.select_related(
+        'author__stats', 'group'), pk=post_id)
     form = CommentForm(request.POST or None,)
+    comments, next_cursor = comments_page(post)
     context = {
         'post': post,
         'form': form,
-        'comments': post.comments.all(),
+        'comments': comments,
+        'next_cursor': next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@etag(post_comments_etag)
+def post_comments(request, post_id):
+    # скрипт страницы поста подставляет фрагмент на место кнопки; без
+    # скрипта или после его ошибки по ссылке открывается целая страница
+    post = get_object_or_404(Post.objects.only('pk', 'text'), pk=post_id)
+    comments, next_cursor = comments_page(post, request.GET.get('after'))
+    context = {
+        'post': post,
+        'comments': comments,
+        'next_cursor': next_cursor,
+    }
+    template = 'posts/comments.html'
+    if request.is_ajax():
+        template = 'posts/includes/comment_list.html'
+    response = render(request, template, context)
+    patch_vary_headers(response, ('X-Requested-With',))
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts, next_cursor = search_posts(
+        query, Post.objects.select_related('author', 'group'),
+        settings.POSTS_ON_PAGE, request.GET.get('after'))
+    context = {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -96,11 +164,15 @@ def add_comment(request, post_id):
 
 
 @login_required
+@etag(follow_index_etag)
 def follow_index(request):
-    post_list = Post.objects.select_related(
-        'group').filter(author__following__user=request.user)
+    pulled = request_pulled_authors(request)
+    post_list = get_feed(request.user, pulled)
     context = {
-        'page_obj': posts_paginator(request, post_list),
+        'page_obj': posts_paginator(
+            request, post_list, count_key('feed', request.user.pk)),
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'cache_version': follow_page_generation(request.user, pulled),
     }
     return render(request, 'posts/follow.html', context)
 
@@ -123,3 +195,58 @@ def profile_unfollow(request, username):
                       author__username=username
                       ).delete()
     return redirect('posts:profile', username)
+
+
+def resized_image(request, width, height, path):
+    if not resize.check_signature(width, height, path, request.GET.get('s')):
+        raise PermissionDenied
+    if not 0 < max(width, height) <= settings.IMAGE_RESIZE_MAX_SIDE:
+        raise Http404
+    try:
+        version = resize.source_version(path)
+        # mtime файла в кеше - время последнего обращения, а содержимое
+        # задают подписанный адрес и версия исходника; навсегда
+        # кешируются только картинки с именем по хешу содержимого
+        immutable = not version
+        return media.file_response(
+            request, resize.resized(path, width, height, version),
+            max_age=settings.IMAGE_RESIZE_MAX_AGE if immutable
+            else settings.MEDIA_REVALIDATE_MAX_AGE,
+            etag=f"{request.GET['s']}-{version}", immutable=immutable)
+    except (OSError, SuspiciousFileOperation):
+        # нет исходника или файл только что вытеснил другой процесс
+        raise Http404
+
+
+def media_file(request, path):
+    # имя по хешу содержимого не переиспользуется; обычные имена после
+    # сборки мусора, перехеширования и у миниатюр sorl могут вернуться
+    # с другим файлом, поэтому их кеш перепроверяется по ETag
+    immutable = is_content_addressed(path)
+    try:
+        return media.file_response(
+            request, safe_join(settings.MEDIA_ROOT, path),
+            accel_path=settings.MEDIA_ACCEL_PREFIX + urlquote(path),
+            immutable=immutable,
+            max_age=settings.MEDIA_MAX_AGE if immutable
+            else settings.MEDIA_REVALIDATE_MAX_AGE)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404
+
+
+def static_file(request, path):
+    try:
+        filename, encoding = staticfiles.negotiate(
+            safe_join(settings.STATIC_ROOT, path),
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        hashed = staticfiles.is_hashed(path)
+        response = media.file_response(
+            request, filename, immutable=hashed,
+            max_age=settings.STATIC_HASHED_MAX_AGE if hashed
+            else settings.STATIC_MAX_AGE)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'posts.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,9 +96,40 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
-STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"),)
+STATICFILES_DIRS = (os.path.join(BASE_DIR, 'project_static'),)
+STATICFILES_STORAGE = 'posts.staticfiles.CompressedManifestStaticFilesStorage'
+# имена с хешем из манифеста кешируются браузером навсегда, остальные -
+# на час
+STATIC_HASHED_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_MAX_AGE = 60 * 60
 
 POSTS_ON_PAGE = 10
+# комментарии под постом: первая страница в самой странице, следующие
+# подгружаются фрагментами
+COMMENTS_ON_PAGE = 20
+# сколько секунд хранится количество постов для пагинатора
+PAGINATOR_COUNT_TIMEOUT = 60 * 5
+# сколько ссылок на страницы показывать по обе стороны от текущей
+PAGINATOR_WINDOW = 3
+# ?page= дальше этой страницы не идет: глубже листают курсором
+PAGINATOR_MAX_PAGE = 20
+
+# фрагменты лент инвалидируются сигналами, таймаут только вытесняет их
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+# ключ карточки меняется вместе с постом, таймаут только вытесняет старые
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# первые страницы index инвалидируются по отдельности
+INDEX_CACHE_PAGES = 10
+
+# сколько последних постов хранится в ленте подписок пользователя
+FEED_MAX_LENGTH = 1000
+# посты авторов с таким числом подписчиков и больше не раскладываются
+# по лентам, а подмешиваются при чтении
+FEED_PUSH_FOLLOWERS_LIMIT = 1000
+
+# строки changelist в админке с фильтрами считаются не дальше этого числа,
+# глубже списки листаются по id
+ADMIN_COUNT_LIMIT = 10000
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -107,6 +139,82 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# кто отдает тело медиафайла: '' - сам Django через FileResponse
+# (sendfile в wsgi.file_wrapper), 'x-accel' - nginx по X-Accel-Redirect
+# в internal location MEDIA_ACCEL_PREFIX, 'x-sendfile' - Apache/lighttpd
+MEDIA_SENDFILE = ''
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# файлы с именем по хешу содержимого кешируются навсегда (immutable),
+# остальные - на MEDIA_REVALIDATE_MAX_AGE с перепроверкой по ETag
+MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_REVALIDATE_MAX_AGE = 60 * 5
+
+DEFAULT_FILE_STORAGE = 'posts.storage.ContentAddressedStorage'
+# каталоги загрузок, файлы в которых называются по sha256 содержимого и
+# не дублируются, например ('posts/'); существующие пути переписывает
+# команда rehash_post_images
+CONTENT_ADDRESSED_UPLOADS = ()
+# ширина вложенных каталогов из начала хеша: posts/3a/7f/3a7f...jpg
+CONTENT_ADDRESSED_SHARDS = (2, 2)
+
+# загрузки больше этого пишутся во временный файл по кускам
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# ограничения картинки поста: байты проверяются при приеме загрузки,
+# пиксели - по заголовку до декодирования. Картинки больше
+# POST_IMAGE_MAX_SIDE по длинной стороне уменьшаются, метаданные
+# (EXIF с геометкой и т.п.) удаляются
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 2560
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# сколько записей kvstore миниатюр держать в памяти процесса
+THUMBNAIL_LRU_SIZE = 10000
+# как часто процесс сверяет поколение удалений миниатюр и сбрасывает LRU
+THUMBNAIL_LRU_CHECK_INTERVAL = 10
+# варианты картинок постов: миниатюры всех ширин и форматов строятся
+# заранее, шаблоны выводят их через srcset/sizes. size - пропорции и
+# ширина src по умолчанию, она должна входить в widths; последний
+# формат - запасной для <img>, WebP пропускается, если Pillow собран
+# без него
+POST_IMAGES = {
+    'card': {
+        'size': (960, 339),
+        'widths': (480, 960, 1440),
+        'formats': ('WEBP', 'JPEG'),
+        'sizes': '(max-width: 992px) 100vw, 960px',
+        'options': {'crop': 'center', 'upscale': True},
+    },
+    # страница поста: без обрезки, высота по пропорциям картинки
+    'detail': {
+        'size': (960, None),
+        'widths': (480, 960, 1440),
+        'formats': ('WEBP', 'JPEG'),
+        'sizes': '(max-width: 768px) 100vw, 720px',
+        'options': {'upscale': True},
+    },
+}
+
+# ответы короче этого не сжимаются; HTML_MINIFY убирает отступы из HTML
+COMPRESS_MIN_SIZE = 1024
+HTML_MINIFY = True
+# страницы с CSRF-токеном не сжимаются (BREACH), см. posts/compression.py;
+# счетчики сжатия сбрасываются в кеш не чаще раза в столько секунд
+COMPRESSION_STATS_FLUSH_INTERVAL = 30
+
+# картинки произвольного размера по подписанному адресу /img/<w>x<h>/...;
+# кеш на диске не больше IMAGE_RESIZE_CACHE_SIZE байт, давно не
+# запрошенные файлы вытесняются
+IMAGE_RESIZE_ROOT = os.path.join(BASE_DIR, 'resize_cache')
+IMAGE_RESIZE_CACHE_SIZE = 512 * 1024 * 1024
+IMAGE_RESIZE_MAX_SIDE = 2560
+IMAGE_RESIZE_MAX_AGE = 60 * 60 * 24 * 365
 
 CACHES = {
     'default': {